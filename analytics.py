@@ -0,0 +1,48 @@
+import streamlit as st
+
+from db import get_database
+from rollups import CUSTOMERS_FILTER
+
+ANALYSIS_CACHE_TTL = 300
+# Names, emails and phone numbers give about one group per customer, so only the
+# largest groups are returned
+ANALYSIS_MAX_GROUPS = 50
+
+# Profile fields offered in the Analysis tab. Credentials, ObjectIds and
+# GridFS references are never pulled into the analysis.
+ANALYSIS_COLUMNS = [
+    "product", "type", "location", "type_of_entity", "name",
+    "contact_person", "email", "contact", "mobile_1", "mobile_2",
+]
+
+
+def group_columns(columns, chart_type):
+    if chart_type in ("Histogram", "Pie"):
+        return list(columns[:1])
+    return list(columns[:2])
+
+
+def build_pipeline(columns, chart_type, max_groups=ANALYSIS_MAX_GROUPS):
+    fields = group_columns(columns, chart_type)
+    # One extra group tells the caller the series was cut off
+    return [
+        {"$match": CUSTOMERS_FILTER},
+        {"$group": {"_id": {field: f"${field}" for field in fields}, "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": max_groups + 1},
+        {"$sort": {"_id": 1}},
+    ]
+
+
+@st.cache_data(ttl=ANALYSIS_CACHE_TTL, show_spinner=False)
+def chart_series(columns, chart_type):
+    groups = list(get_database()["customer"].aggregate(build_pipeline(columns, chart_type)))
+    truncated = len(groups) > ANALYSIS_MAX_GROUPS
+    if truncated:
+        groups.remove(min(groups, key=lambda group: group["count"]))
+    rows = [{**group["_id"], "count": group["count"]} for group in groups]
+    return {"fields": group_columns(columns, chart_type), "rows": rows, "truncated": truncated}
+
+
+def invalidate_analytics():
+    chart_series.clear()
@@ -0,0 +1,251 @@
+"""Headless REST API over the customer data (asyncio, aiohttp + pymongo's async client).
+
+    API_TOKENS=secret1,secret2 python api.py
+
+Every request needs "Authorization: Bearer <token>" with one of API_TOKENS.
+
+    GET   /customers?q=&after=&limit=&fields=     keyset-paginated list, search by prefix
+    POST  /customers                              register {username, password, contact}
+    GET   /customers/{username}?fields=           one customer; ETag is its version
+    PATCH /customers/{username}                   update profile fields; send If-Match: "<version>"
+    GET   /password-reset-requests?after=&limit=  pending requests, oldest first
+    GET   /files/{file_id}                        stream a GridFS document
+
+The Streamlit app runs the migrations; start it (or `python migrations.py`) first.
+"""
+import hmac
+import json
+import os
+import sys
+from datetime import datetime
+from functools import partial
+
+from aiohttp import web
+from bson import ObjectId
+from bson.errors import InvalidId
+from gridfs import AsyncGridFS
+from gridfs.errors import NoFile
+from pymongo import AsyncMongoClient, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from blobs import DOCUMENT_FIELDS
+from db import client_options, load_settings
+from queries import reset_request_filter, user_search_filter
+from rollups import ROLLUP_COLLECTION, ROLLUP_PROJECTION, rollup_deltas
+from validation import PROFILE_FIELDS, validate_details
+from versioning import version_filter
+
+API_HOST = os.environ.get("API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("API_PORT", 8503))
+API_TOKENS = [token.strip() for token in os.environ.get("API_TOKENS", "").split(",") if token.strip()]
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Fields a client may read; passwords are never returned
+READABLE_FIELDS = ["username", *PROFILE_FIELDS, *DOCUMENT_FIELDS, "version"]
+LIST_FIELDS = ["username", "name"]
+# Documents are uploaded through the app, which keeps their reference counts, so
+# the API only edits profile fields
+WRITABLE_FIELDS = PROFILE_FIELDS
+UPDATE_PROJECTION = {**ROLLUP_PROJECTION, "version": 1}
+
+DB = web.AppKey("db")
+FS = web.AppKey("fs")
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _json(data, status=200, headers=None):
+    return web.json_response(data, status=status, headers=headers, dumps=partial(json.dumps, default=_json_default))
+
+
+def _reject(error, *messages):
+    raise error(text=json.dumps({"errors": list(messages)}), content_type="application/json")
+
+
+def _limit(request):
+    try:
+        limit = int(request.query.get("limit", API_PAGE_SIZE))
+    except ValueError:
+        _reject(web.HTTPBadRequest, "limit must be a number")
+    return min(max(limit, 1), API_MAX_PAGE_SIZE)
+
+
+def _projection(request, default):
+    fields = [field.strip() for field in request.query.get("fields", "").split(",") if field.strip()] or default
+    unknown = sorted(set(fields) - set(READABLE_FIELDS))
+    if unknown:
+        _reject(web.HTTPBadRequest, f"Unknown fields: {', '.join(unknown)}")
+    return {"_id": 0, **{field: 1 for field in fields}}
+
+
+async def _body(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        _reject(web.HTTPBadRequest, "Request body must be a JSON object")
+    return body
+
+
+async def _apply_rollup_deltas(db, before, after):
+    operations = rollup_deltas(before, after)
+    if operations:
+        await db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+@web.middleware
+async def authenticate(request, handler):
+    header = request.headers.get("Authorization", "")
+    token = header[len("Bearer "):] if header.startswith("Bearer ") else ""
+    if not any(hmac.compare_digest(token, allowed) for allowed in API_TOKENS):
+        _reject(web.HTTPUnauthorized, "Missing or invalid API token")
+    return await handler(request)
+
+
+async def list_customers(request):
+    limit = _limit(request)
+    # username is always returned, it is the cursor for the next page
+    projection = {**_projection(request, LIST_FIELDS), "username": 1}
+    cursor = request.app[DB]["customer"].find(
+        user_search_filter(request.query.get("q", ""), request.query.get("after")), projection,
+    ).sort("username", 1).limit(limit + 1)
+    customers = await cursor.to_list(limit + 1)
+    has_more = len(customers) > limit
+    customers = customers[:limit]
+    return _json({"items": customers, "next": customers[-1]["username"] if has_more else None})
+
+
+async def register_customer(request):
+    body = await _body(request)
+    username, password, contact = (body.get(field) for field in ("username", "password", "contact"))
+    if not all(isinstance(value, str) and value.strip() for value in (username, password, contact)):
+        _reject(web.HTTPBadRequest, "Please provide username, password, and contact")
+    errors = validate_details({"contact": contact})
+    if errors:
+        _reject(web.HTTPBadRequest, *errors)
+    db = request.app[DB]
+    try:
+        await db["customer"].insert_one({"username": username, "password": password, "contact": contact, "version": 0})
+    except DuplicateKeyError:
+        _reject(web.HTTPConflict, "Username already exists")
+    await _apply_rollup_deltas(db, None, {"username": username})
+    return _json({"username": username, "version": 0}, status=201, headers={"Location": f"/customers/{username}", "ETag": '"0"'})
+
+
+async def get_customer(request):
+    customer = await request.app[DB]["customer"].find_one(
+        {"username": request.match_info["username"]}, {**_projection(request, READABLE_FIELDS), "version": 1},
+    )
+    if customer is None:
+        _reject(web.HTTPNotFound, "Customer not found")
+    return _json(customer, headers={"ETag": f'"{customer.get("version") or 0}"'})
+
+
+async def update_customer(request):
+    username = request.match_info["username"]
+    updates = await _body(request)
+    unknown = sorted(set(updates) - set(WRITABLE_FIELDS))
+    if unknown:
+        _reject(web.HTTPBadRequest, f"Fields cannot be updated: {', '.join(unknown)}")
+    if not updates:
+        _reject(web.HTTPBadRequest, "No fields to update")
+    not_text = sorted(field for field, value in updates.items() if not isinstance(value, str))
+    if not_text:
+        _reject(web.HTTPBadRequest, f"Fields must be strings: {', '.join(not_text)}")
+    errors = validate_details(updates, partial=True)
+    if errors:
+        _reject(web.HTTPBadRequest, *errors)
+
+    query = {"username": username}
+    if_match = request.headers.get("If-Match")
+    if if_match is not None:
+        try:
+            query.update(version_filter(int(if_match.strip().removeprefix("W/").strip('"'))))
+        except ValueError:
+            _reject(web.HTTPBadRequest, "If-Match must be a customer version")
+    db = request.app[DB]
+    before = await db["customer"].find_one_and_update(
+        query, {"$set": updates, "$inc": {"version": 1}}, projection=UPDATE_PROJECTION, return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        if if_match is not None and await db["customer"].count_documents({"username": username}, limit=1):
+            _reject(web.HTTPPreconditionFailed, f"{username} was changed by someone else since it was loaded. Reload and apply your changes again.")
+        _reject(web.HTTPNotFound, "Customer not found")
+    await _apply_rollup_deltas(db, before, {**before, **updates})
+    version = (before.get("version") or 0) + 1
+    return _json({"username": username, "version": version}, headers={"ETag": f'"{version}"'})
+
+
+async def list_password_reset_requests(request):
+    limit = _limit(request)
+    after = request.query.get("after")
+    try:
+        query = reset_request_filter(ObjectId(after) if after else None)
+    except InvalidId:
+        _reject(web.HTTPBadRequest, "after must be a request id")
+    cursor = request.app[DB]["password_reset_requests"].find(query, {"username": 1, "contact": 1, "created_at": 1}).sort("_id", 1).limit(limit + 1)
+    requests = await cursor.to_list(limit + 1)
+    has_more = len(requests) > limit
+    requests = requests[:limit]
+    return _json({"items": requests, "next": str(requests[-1]["_id"]) if has_more else None})
+
+
+async def get_file(request):
+    # Streamed one GridFS chunk at a time, like the Streamlit file server
+    try:
+        grid_out = await request.app[FS].get(ObjectId(request.match_info["file_id"]))
+    except (InvalidId, NoFile):
+        _reject(web.HTTPNotFound, "File not found")
+    etag = f'"{grid_out._id}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if request.headers.get("If-None-Match") == etag:
+        return web.Response(status=304, headers=headers)
+    response = web.StreamResponse(headers=headers)
+    response.content_type = grid_out.content_type or "application/octet-stream"
+    response.content_length = grid_out.length
+    await response.prepare(request)
+    while True:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        await response.write(chunk)
+    await response.write_eof()
+    return response
+
+
+async def mongo_client(app):
+    # One pooled client per API process, configured like the app's (db.load_settings)
+    settings = load_settings()
+    client = AsyncMongoClient(settings["uri"], **client_options(settings))
+    app[DB] = client[settings["database"]]
+    app[FS] = AsyncGridFS(app[DB])
+    yield
+    await client.close()
+
+
+def create_app():
+    app = web.Application(middlewares=[authenticate])
+    app.cleanup_ctx.append(mongo_client)
+    app.add_routes([
+        web.get("/customers", list_customers),
+        web.post("/customers", register_customer),
+        web.get("/customers/{username}", get_customer),
+        web.patch("/customers/{username}", update_customer),
+        web.get("/password-reset-requests", list_password_reset_requests),
+        web.get(r"/files/{file_id:[0-9a-f]{24}}", get_file),
+    ])
+    return app
+
+
+if __name__ == "__main__":
+    if not API_TOKENS:
+        sys.exit("Set API_TOKENS to a comma-separated list of bearer tokens")
+    web.run_app(create_app(), host=API_HOST, port=API_PORT)
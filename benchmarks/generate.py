@@ -0,0 +1,162 @@
+"""Synthetic CRM dataset for benchmarks.
+
+    python benchmarks/generate.py --customers 100000 --image-kb 800 --pdf-kb 300
+
+Writes to MONGO_URI / MONGO_DATABASE (default Fintree_Finance_bench), so point it
+at a scratch database. The same --seed always produces the same data.
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("MONGO_DATABASE", "Fintree_Finance_bench")
+
+from blobs import DOCUMENT_FIELDS  # noqa: E402
+from validation import ENTITY_TYPES, LOCATIONS, PRODUCTS, REQUIRED_DOCUMENTS, TYPES  # noqa: E402
+
+INSERT_BATCH_SIZE = 1000
+PASSWORD = "bench-password"
+
+
+def username_for(number):
+    return f"user{number:07d}"
+
+
+def next_user_number(db):
+    # Numbering continues after the last generated customer, so --keep adds new ones
+    last = db["customer"].find_one({"username": {"$regex": r"^user\d{7}$"}}, {"username": 1}, sort=[("username", -1)])
+    return int(last["username"][len("user"):]) + 1 if last else 0
+
+
+def make_image(rng, size_kb):
+    # Noise barely compresses, so the JPEG ends up close to the requested size
+    from PIL import Image
+
+    side = max(int((size_kb * 1024 / 1.5) ** 0.5), 16)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), rng.randbytes(side * side * 3)).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def make_pdf(rng, size_kb):
+    # A one-page PDF whose content stream is padded to the requested size
+    padding = "".join(rng.choices(string.ascii_letters, k=max(size_kb * 1024 - 400, 0)))
+    stream = f"BT /F1 24 Tf 72 720 Td (Synthetic KYC document) Tj ET\n% {padding}\n"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}endstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    body, offsets = "%PDF-1.4\n", []
+    for number, content in enumerate(objects, start=1):
+        offsets.append(len(body))
+        body += f"{number} 0 obj\n{content}\nendobj\n"
+    xref = len(body)
+    body += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    body += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    body += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return body.encode(), "application/pdf"
+
+
+def store_blobs(db, fs, rng, count, image_kb, pdf_kb):
+    # A pool of distinct documents shared by all customers, stored the way blobs.py
+    # stores deduplicated uploads (sha256 + refs)
+    file_ids = []
+    for number in range(count):
+        data, content_type = make_image(rng, image_kb) if number % 2 == 0 else make_pdf(rng, pdf_kb)
+        extension = "jpg" if content_type == "image/jpeg" else "pdf"
+        file_ids.append(fs.put(
+            data,
+            filename=f"bench-{number}.{extension}",
+            content_type=content_type,
+            sha256=hashlib.sha256(data).hexdigest(),
+            refs=0,
+        ))
+    return file_ids
+
+
+def make_customer(rng, number, file_ids):
+    customer = {
+        "username": username_for(number),
+        "password": PASSWORD,
+        "contact": f"9{rng.randrange(10 ** 9):09d}",
+        "email": f"{username_for(number)}@example.com",
+        "product": rng.choice(PRODUCTS),
+        "type": rng.choice(TYPES),
+        "location": rng.choice(LOCATIONS),
+        "name": f"{rng.choice(['Asha', 'Ravi', 'Meera', 'Kiran', 'Sunil', 'Priya'])} {rng.choice(['Patil', 'Shah', 'Iyer', 'Gupta', 'Khan'])}",
+        "type_of_entity": rng.choice(ENTITY_TYPES),
+        "contact_person": rng.choice(["Self", "Manager", "Partner"]),
+        "mobile_1": f"9{rng.randrange(10 ** 9):09d}",
+        "mobile_2": f"8{rng.randrange(10 ** 9):09d}",
+        "version": 0,
+    }
+    if file_ids:
+        optional = [field for field in DOCUMENT_FIELDS if field not in REQUIRED_DOCUMENTS]
+        for field in REQUIRED_DOCUMENTS + rng.sample(optional, rng.randrange(len(optional) + 1)):
+            customer[field] = rng.choice(file_ids)
+    return customer
+
+
+def generate(db, fs, customers, image_kb, pdf_kb, distinct_blobs, seed, drop):
+    from pymongo import UpdateOne
+
+    from migrations import run_migrations
+    from rollups import reconcile
+
+    if drop:
+        for name in ["customer", "customer_rollups", "fs.files", "fs.chunks", "password_reset_requests", "mail_queue", "schema_migrations"]:
+            db.drop_collection(name)
+        run_migrations(db)
+    first = next_user_number(db)
+    # A run that adds to existing data gets its own stream, so its documents do not
+    # repeat earlier content hashes (sha256_unique)
+    rng = random.Random(seed if first == 0 else f"{seed}:{first}")
+
+    started = time.perf_counter()
+    file_ids = store_blobs(db, fs, rng, distinct_blobs, image_kb, pdf_kb)
+    references = {}
+    batch = []
+    for number in range(first, first + customers):
+        customer = make_customer(rng, number, file_ids)
+        for field in DOCUMENT_FIELDS:
+            if field in customer:
+                references[customer[field]] = references.get(customer[field], 0) + 1
+        batch.append(customer)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db["customer"].insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        db["customer"].insert_many(batch, ordered=False)
+    if references:
+        db["fs.files"].bulk_write([UpdateOne({"_id": file_id}, {"$inc": {"refs": count}}) for file_id, count in references.items()])
+    reconcile(db)
+    return {"customers": customers, "blobs": len(file_ids), "seconds": round(time.perf_counter() - started, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--image-kb", type=int, default=500, help="approximate size of each synthetic image scan")
+    parser.add_argument("--pdf-kb", type=int, default=200, help="approximate size of each synthetic PDF")
+    parser.add_argument("--distinct-blobs", type=int, default=20, help="distinct documents shared by all customers (0 for none)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="add to the existing data instead of dropping it first")
+    args = parser.parse_args()
+
+    from db import get_database, get_fs
+
+    print(generate(get_database(), get_fs(), args.customers, args.image_kb, args.pdf_kb, args.distinct_blobs, args.seed, drop=not args.keep))
+
+
+if __name__ == "__main__":
+    main()
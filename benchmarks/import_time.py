@@ -0,0 +1,85 @@
+"""Import-time report for the login path.
+
+    python benchmarks/import_time.py [--budget-ms 400] [--output report.json]
+
+Runs main.py's top-level imports (not the rest of main.py, so no database is
+needed) in a fresh interpreter under `python -X importtime`, and compares them
+with a bare `import streamlit`. Prints the modules the app adds, slowest first,
+and exits non-zero if one of HEAVY_MODULES is loaded or the budget is exceeded.
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only the sections that need them may import these
+HEAVY_MODULES = ["pandas", "plotly", "PIL", "fitz", "smtplib", "pyarrow", "openpyxl", "aiohttp"]
+
+
+def main_imports():
+    with open(os.path.join(ROOT, "main.py")) as source:
+        tree = ast.parse(source.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def import_times(code):
+    # {module: (self_us, cumulative_us)} for every module the code imports
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode:
+        sys.exit(result.stderr)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def report(budget_ms=None, top=25):
+    baseline = import_times("import streamlit")
+    app = import_times(main_imports())
+    added = {name: times for name, times in app.items() if name not in baseline}
+    added_ms = sum(own for own, _ in added.values()) / 1000
+    heavy = sorted({name.split(".")[0] for name in added} & set(HEAVY_MODULES))
+    return {
+        "streamlit_ms": round(sum(own for own, _ in baseline.values()) / 1000, 1),
+        "app_ms": round(added_ms, 1),
+        "app_modules": len(added),
+        "slowest": [
+            {"module": name, "self_ms": round(own / 1000, 2), "cumulative_ms": round(cumulative / 1000, 2)}
+            for name, (own, cumulative) in sorted(added.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        ],
+        "heavy_modules": heavy,
+        "over_budget": budget_ms is not None and added_ms > budget_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, help="fail if the app's own imports take longer than this")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args()
+
+    result = report(args.budget_ms, args.top)
+    print(f"import streamlit: {result['streamlit_ms']} ms; main.py imports add {result['app_ms']} ms over {result['app_modules']} modules")
+    for entry in result["slowest"]:
+        print(f"  {entry['cumulative_ms']:>9.2f} ms  {entry['module']}")
+    if args.output:
+        with open(args.output, "w") as target:
+            json.dump(result, target, indent=2)
+    if result["heavy_modules"]:
+        sys.exit(f"Heavy modules imported on the login path: {', '.join(result['heavy_modules'])}")
+    if result["over_budget"]:
+        sys.exit(f"main.py imports take {result['app_ms']} ms, over the {args.budget_ms} ms budget")
+
+
+if __name__ == "__main__":
+    main()
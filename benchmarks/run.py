@@ -0,0 +1,256 @@
+"""Latency and memory benchmarks for the CRM app.
+
+    python benchmarks/generate.py --customers 100000
+    python benchmarks/run.py --iterations 200
+    python benchmarks/run.py --compare benchmarks/results/old.json benchmarks/results/new.json
+
+Times the main.py helpers behind login, user listing, detail view, update,
+analysis and file display, then drives the app headlessly with AppTest. Needs a
+running mongod and the database filled by generate.py (same MONGO_* settings).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("MONGO_DATABASE", "Fintree_Finance_bench")
+
+from generate import PASSWORD  # noqa: E402
+from rollups import CUSTOMERS_FILTER  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+APP_TIMEOUT = 120
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def summarize(samples, peak_bytes):
+    milliseconds = [sample * 1000 for sample in samples]
+    return {
+        "n": len(milliseconds),
+        "mean_ms": round(sum(milliseconds) / len(milliseconds), 3),
+        "p50_ms": round(percentile(milliseconds, 0.50), 3),
+        "p90_ms": round(percentile(milliseconds, 0.90), 3),
+        "p99_ms": round(percentile(milliseconds, 0.99), 3),
+        "max_ms": round(max(milliseconds), 3),
+        "peak_kb": round(peak_bytes / 1024, 1),
+    }
+
+
+def measure(name, operation, iterations, warmup=3):
+    # Timings and allocations are taken in separate passes because tracemalloc
+    # slows every allocation down
+    for _ in range(warmup):
+        operation()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    for _ in range(max(iterations // 10, 1)):
+        operation()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    result = summarize(samples, peak)
+    print(f"{name:<28} p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms  peak {result['peak_kb']:>9.1f} KB")
+    return result
+
+
+def helper_scenarios(app, usernames, rng):
+    # Each scenario picks its own customer so cached reads do not hide the database
+    from analytics import invalidate_analytics
+    from blobs import DOCUMENT_FIELDS
+    from file_server import file_url
+    from thumbnails import find_file_and_derivatives
+
+    def login():
+        app.user_exists(rng.choice(usernames), PASSWORD)
+
+    def listing():
+        app.search_users("", after=rng.choice(usernames))
+
+    def listing_search():
+        app.search_users(rng.choice(usernames)[:8])
+
+    def detail_view():
+        username = rng.choice(usernames)
+        app.invalidate_customer(username)
+        app.get_customer_detail(username)
+
+    def detail_view_cached():
+        # Outside a Streamlit session there is no rerun tier, so this is a hit in the
+        # process-wide tier: the first read of a customer in a production rerun
+        app.get_customer_detail(usernames[0])
+
+    def update():
+        username = rng.choice(usernames)
+        details = app.get_customer_detail(username)
+        app.update_customer_detail(username, {"contact_person": rng.choice(["Self", "Manager", "Partner"])}, details.get("version"))
+
+    def analysis():
+        invalidate_analytics()
+        app.get_rollups(app.db)
+        app.chart_series(("product", "location"), "Bar")
+
+    def file_display():
+        details = app.get_customer_detail(rng.choice(usernames))
+        file_id = next((details[field] for field in DOCUMENT_FIELDS if details.get(field)), None)
+        if file_id is None:
+            return
+        original, derivatives = find_file_and_derivatives(app.db, file_id)
+        shown = derivatives.get("thumbnail") or derivatives.get("preview") or original
+        with urllib.request.urlopen(file_url(shown["_id"])) as response:
+            while response.read(256 * 1024):
+                pass
+
+    return {
+        "login": login,
+        "user_listing": listing,
+        "user_search": listing_search,
+        "detail_view": detail_view,
+        "detail_view_cached": detail_view_cached,
+        "update": update,
+        "analysis": analysis,
+        "file_display": file_display,
+    }
+
+
+def app_scenarios(usernames, rng):
+    # Each run starts a fresh headless session, like a browser opening the app
+    from streamlit.testing.v1 import AppTest
+
+    script = os.path.join(ROOT, "main.py")
+
+    def session(**state):
+        at = AppTest.from_file(script, default_timeout=APP_TIMEOUT)
+        for key, value in state.items():
+            at.session_state[key] = value
+        return at
+
+    def run(at):
+        at.run()
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    def login_page():
+        run(session())
+
+    def login():
+        at = session()
+        run(at)
+        at.text_input(key="login_username").input(rng.choice(usernames))
+        at.text_input(key="login_password").input(PASSWORD)
+        at.button(key="login_submit").click()
+        run(at)
+
+    def customer(section):
+        def scenario():
+            run(session(logged_in=True, username=rng.choice(usernames), is_admin=False, new_user=False, customer_section=section))
+        return scenario
+
+    def admin(section):
+        def scenario():
+            run(session(logged_in=True, username="f", is_admin=True, new_user=False, admin_section=section))
+        return scenario
+
+    return {
+        "app_login_page": login_page,
+        "app_login": login,
+        "app_customer_view": customer("View Details"),
+        "app_customer_update": customer("Update Details"),
+        "app_admin_users": admin("View All Users"),
+        "app_admin_analysis": admin("Analysis"),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(iterations, app_iterations, seed, include_app):
+    import main as app
+
+    rng = random.Random(seed)
+    usernames = [customer["username"] for customer in app.collection.find(CUSTOMERS_FILTER, {"username": 1, "_id": 0})]
+    if not usernames:
+        sys.exit("No customers found; run benchmarks/generate.py first")
+
+    results = {}
+    for name, operation in helper_scenarios(app, usernames, rng).items():
+        results[name] = measure(name, operation, iterations)
+    if include_app:
+        for name, operation in app_scenarios(usernames, rng).items():
+            results[name] = measure(name, operation, app_iterations, warmup=1)
+
+    return {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "database": app.db.name,
+            "customers": len(usernames),
+            "files": app.db["fs.files"].estimated_document_count(),
+            "iterations": iterations,
+            "app_iterations": app_iterations if include_app else 0,
+            "python": platform.python_version(),
+            "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline_path, candidate_path):
+    with open(baseline_path) as baseline_file, open(candidate_path) as candidate_file:
+        baseline, candidate = json.load(baseline_file), json.load(candidate_file)
+    print(f"{'scenario':<28}{'p50 before':>12}{'p50 after':>12}{'change':>9}{'p99 before':>12}{'p99 after':>12}{'change':>9}")
+    for name, after in candidate["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        row = f"{name:<28}"
+        for metric in ("p50_ms", "p99_ms"):
+            change = (after[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0
+            row += f"{before[metric]:>12.2f}{after[metric]:>12.2f}{change:>8.1f}%"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per helper scenario")
+    parser.add_argument("--app-iterations", type=int, default=20, help="timed AppTest runs per app scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-app", action="store_true", help="skip the AppTest scenarios")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.iterations, args.app_iterations, args.seed, include_app=not args.no_app)
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as target:
+        json.dump(report, target, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
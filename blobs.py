@@ -0,0 +1,212 @@
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from gridfs.errors import FileExists
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# Customer fields holding GridFS file ids
+DOCUMENT_FIELDS = [
+    "Signed Agreement", "PAN", "Cancelled Cheque", "GST",
+    "Shop Establishment Certificate", "Partnership Deed", "Certificate of Incorporation",
+]
+HASH_BLOCK_SIZE = 1 << 20
+# Files younger than this may belong to a submission that has not saved its customer document yet
+SWEEP_GRACE = timedelta(hours=1)
+SWEEP_INTERVAL = int(os.environ.get("BLOB_SWEEP_INTERVAL", 86400))
+SWEEP_BATCH_SIZE = 1000
+FILE_PROJECTION = {"filename": 1, "length": 1, "uploadDate": 1, "refs": 1, "acquired_at": 1, "metadata.derivative_of": 1}
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def content_hash(file):
+    file.seek(0)
+    digest = hashlib.sha256()
+    for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _acquire_existing(db, sha256):
+    existing = db["fs.files"].find_one_and_update(
+        {"sha256": sha256, "refs": {"$gt": 0}},
+        # acquired_at restarts the sweep grace period, like a fresh upload
+        {"$inc": {"refs": 1}, "$currentDate": {"acquired_at": True}},
+        projection={"_id": 1},
+    )
+    return existing["_id"] if existing else None
+
+
+def store_file(db, fs, file):
+    # Identical content is stored once; each caller holds one reference to the file
+    sha256 = content_hash(file)
+    for _ in range(2):
+        file_id = _acquire_existing(db, sha256)
+        if file_id:
+            return file_id
+        grid_in = fs.new_file(filename=file.name, content_type=file.type, sha256=sha256, refs=1)
+        try:
+            grid_in.write(file)
+            grid_in.close()
+        except (DuplicateKeyError, FileExists):
+            # Another session stored the same content first: drop our chunks and reuse theirs
+            fs.delete(grid_in._id)
+            file.seek(0)
+            continue
+        except BaseException:
+            grid_in.abort()
+            raise
+        return grid_in._id
+    raise FileExists(f"Could not store or reuse content {sha256}")
+
+
+def _delete_with_derivatives(db, fs, file_id):
+    for derivative in db["fs.files"].find({"metadata.derivative_of": file_id}, {"_id": 1}):
+        fs.delete(derivative["_id"])
+    fs.delete(file_id)
+
+
+def release_files(db, fs, file_ids):
+    # Files stored before deduplication have no refs field and count as one reference
+    for file_id in file_ids:
+        released = db["fs.files"].find_one_and_update(
+            {"_id": file_id},
+            {"$inc": {"refs": -1}},
+            projection={"refs": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if released and released["refs"] <= 0:
+            if db["fs.files"].delete_one({"_id": file_id, "refs": {"$lte": 0}}).deleted_count:
+                _delete_with_derivatives(db, fs, file_id)
+
+
+def replaced_files(before, after):
+    # Every file written into a field carries its own reference, even when the content
+    # deduplicated to the id already there, so the previous value is always released
+    if not before:
+        return []
+    return [before[field] for field in DOCUMENT_FIELDS if before.get(field) and (after is None or field in after)]
+
+
+def _referenced_ids(db):
+    # Only the referenced ids are kept in memory, not the customer documents
+    references = Counter()
+    for customer in db["customer"].find({}, {field: 1 for field in DOCUMENT_FIELDS}, batch_size=SWEEP_BATCH_SIZE):
+        references.update(customer[field] for field in DOCUMENT_FIELDS if customer.get(field))
+    return references
+
+
+def _is_referenced(db, file_id):
+    return db["customer"].count_documents({"$or": [{field: file_id} for field in DOCUMENT_FIELDS]}, limit=1) > 0
+
+
+def _missing_originals(db, derivatives):
+    existing = {file["_id"] for file in db["fs.files"].find({"_id": {"$in": [file["metadata"]["derivative_of"] for file in derivatives]}}, {"_id": 1})}
+    return [file for file in derivatives if file["metadata"]["derivative_of"] not in existing]
+
+
+def find_orphans(db, grace=SWEEP_GRACE):
+    # Streams fs.files and yields ("orphan", file, refs) for originals no customer
+    # references that were neither uploaded nor reused within the grace period,
+    # ("refs", file, count) for reference counts below the number of customer
+    # fields pointing at the file, and ("derivative", file, None) for thumbnails
+    # whose original is gone
+    references = _referenced_ids(db)
+    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - grace
+    for file in db["fs.files"].find({"metadata.derivative_of": {"$exists": False}}, FILE_PROJECTION, batch_size=SWEEP_BATCH_SIZE):
+        count = references[file["_id"]]
+        if count and file.get("refs", 1) < count:
+            yield "refs", file, count
+        elif not count and file["uploadDate"] < cutoff and file.get("acquired_at", file["uploadDate"]) < cutoff:
+            yield "orphan", file, file.get("refs")
+
+    batch = []
+    for file in db["fs.files"].find({"metadata.derivative_of": {"$exists": True}}, FILE_PROJECTION, batch_size=SWEEP_BATCH_SIZE):
+        batch.append(file)
+        if len(batch) >= SWEEP_BATCH_SIZE:
+            for derivative in _missing_originals(db, batch):
+                yield "derivative", derivative, None
+            batch = []
+    if batch:
+        for derivative in _missing_originals(db, batch):
+            yield "derivative", derivative, None
+
+
+def _delete_orphan(db, fs, file, refs):
+    # refs drops to 0 only if nobody acquired the file since it was read, which also
+    # stops _acquire_existing from handing it to a new upload. A customer saved in
+    # between gets its references back.
+    if not db["fs.files"].update_one({"_id": file["_id"], "refs": refs}, {"$set": {"refs": 0}}).matched_count:
+        return False
+    if _is_referenced(db, file["_id"]):
+        db["fs.files"].update_one({"_id": file["_id"]}, {"$inc": {"refs": refs or 1}})
+        return False
+    if not db["fs.files"].delete_one({"_id": file["_id"], "refs": 0}).deleted_count:
+        return False
+    _delete_with_derivatives(db, fs, file["_id"])
+    return True
+
+
+def sweep(db, fs, dry_run=True, grace=SWEEP_GRACE):
+    report = {"dry_run": dry_run, "orphans": [], "orphan_bytes": 0, "refcount_fixes": 0}
+    fixes = []
+    for kind, file, refs in find_orphans(db, grace):
+        if kind == "refs":
+            # Counts are only ever raised: a count that is too high leaks storage until
+            # the next sweep, one that is too low would delete a file still in use
+            report["refcount_fixes"] += 1
+            if not dry_run:
+                fixes.append(UpdateOne({"_id": file["_id"]}, {"$max": {"refs": refs}}))
+                if len(fixes) >= SWEEP_BATCH_SIZE:
+                    db["fs.files"].bulk_write(fixes, ordered=False)
+                    fixes = []
+            continue
+        if not dry_run:
+            if kind == "derivative":
+                fs.delete(file["_id"])
+            elif not _delete_orphan(db, fs, file, refs):
+                continue
+        report["orphans"].append({
+            "_id": str(file["_id"]),
+            "filename": file.get("filename"),
+            "length": file.get("length", 0),
+            "uploadDate": file["uploadDate"].isoformat(),
+        })
+        report["orphan_bytes"] += file.get("length", 0)
+    if fixes:
+        db["fs.files"].bulk_write(fixes, ordered=False)
+    return report
+
+
+def _sweep_forever(db, fs, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            sweep(db, fs, dry_run=False)
+        except Exception as exc:
+            print(f"Blob sweep failed: {exc}")
+
+
+def start_sweeper(db, fs, interval=SWEEP_INTERVAL):
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None or not _sweeper.is_alive():
+            _sweeper = threading.Thread(target=_sweep_forever, args=(db, fs, interval), name="blob-sweeper", daemon=True)
+            _sweeper.start()
+    return _sweeper
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    from db import get_database, get_fs
+
+    print(json.dumps(sweep(get_database(), get_fs(), dry_run="--delete" not in sys.argv), indent=2))
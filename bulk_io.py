@@ -0,0 +1,179 @@
+import codecs
+import csv
+import io
+import os
+import zipfile
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from rollups import CUSTOMERS_FILTER
+from validation import PROFILE_FIELDS, validate_details
+
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = ["username", *PROFILE_FIELDS]
+EXPORT_FORMATS = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+# Raised while reading a file that is not UTF-8 CSV or not a valid workbook
+# (UnicodeDecodeError is a ValueError)
+PARSE_ERRORS = (ValueError, csv.Error, zipfile.BadZipFile)
+
+
+def _cell(value):
+    # Spreadsheets turn phone numbers into numbers; the forms store them as digit strings
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _csv_rows(file):
+    # Decoded line by line, so a byte that is not UTF-8 fails on its own row
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    reader = csv.DictReader(decoder.decode(line) for line in file)
+    for row_number, row in enumerate(reader, start=2):
+        yield row_number, {(key or "").strip(): _cell(value) for key, value in row.items()}
+
+
+def _excel_rows(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_cell(name) for name in next(rows, [])]
+        for row_number, values in enumerate(rows, start=2):
+            yield row_number, dict(zip(header, (_cell(value) for value in values)))
+    finally:
+        workbook.close()
+
+
+def read_rows(file, filename):
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _excel_rows(file)
+    return _csv_rows(file)
+
+
+def parse_row(row):
+    username = row.get("username", "")
+    if not username:
+        return None, ["username is required"]
+    # Both mobile numbers are compulsory, as in the Add Details form
+    details = {"username": username, "mobile_1": row.get("mobile_1", ""), "mobile_2": row.get("mobile_2", "")}
+    for field in PROFILE_FIELDS:
+        if row.get(field):
+            details[field] = row[field]
+    if row.get("password"):
+        details["password"] = row["password"]
+    return details, validate_details(details)
+
+
+def _flush(collection, operations, row_numbers, report):
+    try:
+        result = collection.bulk_write(operations, ordered=False).bulk_api_result
+    except BulkWriteError as exc:
+        result = exc.details
+        for error in result["writeErrors"]:
+            report["errors"].append({"row": row_numbers[error["index"]], "errors": [error["errmsg"]]})
+    report["inserted"] += result["nUpserted"]
+    report["updated"] += result["nModified"]
+
+
+def import_customers(db, file, filename, size=None, progress=None, batch_size=IMPORT_BATCH_SIZE):
+    # Rows are parsed one at a time and written in unordered batches, so memory use
+    # depends on the batch size, not the file size. progress(fraction, rows) is
+    # called after every batch; the fraction is estimated from the bytes read.
+    # A file that cannot be read is reported as an error on the row after the last
+    # one read; the rows before it are still imported
+    report = {"rows": 0, "inserted": 0, "updated": 0, "errors": []}
+    operations, row_numbers = [], []
+    rows = read_rows(file, filename)
+    row_number = 1
+    while True:
+        try:
+            row_number, row = next(rows)
+        except StopIteration:
+            break
+        except PARSE_ERRORS as exc:
+            report["errors"].append({"row": row_number + 1, "errors": [f"The file could not be read from here on ({exc}); save it as UTF-8 CSV or .xlsx"]})
+            break
+        report["rows"] += 1
+        details, errors = parse_row(row)
+        if errors:
+            report["errors"].append({"row": row_number, "errors": errors})
+            continue
+        operations.append(UpdateOne({"username": details["username"]}, {"$set": details, "$inc": {"version": 1}}, upsert=True))
+        row_numbers.append(row_number)
+        if len(operations) >= batch_size:
+            _flush(db["customer"], operations, row_numbers, report)
+            operations, row_numbers = [], []
+            if progress:
+                progress(min(file.tell() / size, 1.0) if size else 0.0, report["rows"])
+    if operations:
+        _flush(db["customer"], operations, row_numbers, report)
+    if progress:
+        progress(1.0, report["rows"])
+    return report
+
+
+def export_batches(db, batch_size=EXPORT_BATCH_SIZE):
+    cursor = db["customer"].find(CUSTOMERS_FILTER, {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}}, batch_size=batch_size)
+    batch = []
+    for customer in cursor:
+        batch.append({field: _cell(customer.get(field)) for field in EXPORT_FIELDS})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def stream_csv(db, batch_size=EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_FIELDS)
+    writer.writeheader()
+    for batch in export_batches(db, batch_size):
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def write_parquet(db, sink, batch_size=EXPORT_BATCH_SIZE):
+    # One row group per cursor batch
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(field, pa.string()) for field in EXPORT_FIELDS])
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in export_batches(db, batch_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    from db import get_database
+    from rollups import reconcile
+
+    usage = "usage: python bulk_io.py import <file.csv|file.xlsx> | export <out.csv|out.parquet>"
+    if len(sys.argv) != 3 or sys.argv[1] not in ("import", "export"):
+        sys.exit(usage)
+    command, path = sys.argv[1:]
+    database = get_database()
+    if command == "import":
+        with open(path, "rb") as source:
+            try:
+                print(json.dumps(import_customers(database, source, path, size=os.path.getsize(path)), indent=2))
+            finally:
+                reconcile(database)
+    elif path.endswith(".parquet"):
+        write_parquet(database, path)
+    else:
+        with open(path, "wb") as target:
+            for data in stream_csv(database):
+                target.write(data)
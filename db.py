@@ -0,0 +1,200 @@
+import atexit
+import os
+import threading
+
+import gridfs
+from pymongo import MongoClient, monitoring
+
+from migrations import run_migrations
+from profiler import profiler
+
+# Defaults, each overridable through an environment variable or a [mongo]
+# section in .streamlit/secrets.toml
+DEFAULT_SETTINGS = {
+    "uri": "mongodb://localhost:27017",
+    "database": "Fintree_Finance",
+    "max_pool_size": 50,
+    "min_pool_size": 0,
+    "max_idle_time_ms": 300000,
+    "connect_timeout_ms": 5000,
+    "server_selection_timeout_ms": 5000,
+    "socket_timeout_ms": 30000,
+    "wait_queue_timeout_ms": 10000,
+    "compressors": "zstd,snappy,zlib",
+    # Record every command for the admin Query Profiler section and /metrics. Off by
+    # default: it walks the stack for every command
+    "profile_commands": 0,
+}
+
+_lock = threading.Lock()
+_client = None
+_database_name = None
+_pool_stats = None
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "open_connections": self.created - self.closed,
+                "connections_created": self.created,
+                "connections_closed": self.closed,
+                "checkouts": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+            }
+
+
+def _secrets():
+    try:
+        import streamlit as st
+        return dict(st.secrets.get("mongo", {}))
+    except Exception:
+        return {}
+
+
+def load_settings():
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(_secrets())
+    for key, default in DEFAULT_SETTINGS.items():
+        value = os.environ.get(f"MONGO_{key.upper()}")
+        if value is not None:
+            settings[key] = type(default)(value)
+    return settings
+
+
+def _available_compressors(requested):
+    available = ["zlib"]
+    try:
+        import zstandard  # noqa: F401
+        available.append("zstd")
+    except ImportError:
+        pass
+    try:
+        import snappy  # noqa: F401
+        available.append("snappy")
+    except ImportError:
+        pass
+    return [name for name in requested.split(",") if name.strip() in available]
+
+
+def client_options(settings):
+    # Shared by the Streamlit process and the async REST API (api.py)
+    return {
+        "maxPoolSize": settings["max_pool_size"],
+        "minPoolSize": settings["min_pool_size"],
+        "maxIdleTimeMS": settings["max_idle_time_ms"],
+        "connectTimeoutMS": settings["connect_timeout_ms"],
+        "serverSelectionTimeoutMS": settings["server_selection_timeout_ms"],
+        "socketTimeoutMS": settings["socket_timeout_ms"],
+        "waitQueueTimeoutMS": settings["wait_queue_timeout_ms"],
+        "compressors": _available_compressors(settings["compressors"]),
+    }
+
+
+def get_client():
+    global _client, _database_name, _pool_stats
+    if _client is None:
+        with _lock:
+            if _client is None:
+                settings = load_settings()
+                _pool_stats = PoolStats()
+                listeners = [_pool_stats]
+                if settings["profile_commands"]:
+                    profiler.enabled = True
+                    listeners.append(profiler)
+                client = MongoClient(settings["uri"], event_listeners=listeners, **client_options(settings))
+                try:
+                    run_migrations(client[settings["database"]])
+                except Exception:
+                    client.close()
+                    raise
+                _database_name = settings["database"]
+                _client = client
+    return _client
+
+
+def get_database():
+    client = get_client()
+    return client[_database_name]
+
+
+_fs = None
+
+
+def get_fs():
+    global _fs
+    if _fs is None:
+        _fs = gridfs.GridFS(get_database())
+    return _fs
+
+
+def pool_stats():
+    client = _client
+    if client is None:
+        return {}
+    stats = _pool_stats.snapshot()
+    stats["max_pool_size"] = client.options.pool_options.max_pool_size
+    return stats
+
+
+def close_client():
+    global _client, _fs
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            _fs = None
+
+
+atexit.register(close_client)
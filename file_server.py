@@ -0,0 +1,239 @@
+import calendar
+import hashlib
+import hmac
+import math
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+from bulk_io import EXPORT_FORMATS, stream_csv, write_parquet
+from db import get_database, get_fs
+from profiler import profiler
+
+FILE_SERVER_HOST = os.environ.get("FILE_SERVER_HOST", "127.0.0.1")
+FILE_SERVER_PORT = int(os.environ.get("FILE_SERVER_PORT", 8502))
+# Address the browser uses to reach the server, e.g. behind a reverse proxy
+FILE_SERVER_URL = os.environ.get("FILE_SERVER_URL", f"http://localhost:{FILE_SERVER_PORT}")
+# Signed URLs stay identical for a whole TTL window so the browser cache can reuse them
+URL_TTL = int(os.environ.get("FILE_URL_TTL", 3600))
+_secret = os.environ.get("FILE_SERVER_SECRET", secrets.token_hex(32)).encode()
+
+FILE_PATH = re.compile(r"^/files/([0-9a-f]{24})$")
+EXPORT_PATH = re.compile(r"^/exports/customers\.(csv|parquet)$")
+EXPORT_CHUNK_SIZE = 1 << 16
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Prometheus scrapes /metrics unsigned; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+METRICS_PATH = "/metrics"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def _signature(path, expires):
+    return hmac.new(_secret, f"{path}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def signed_url(path):
+    expires = math.ceil((time.time() + URL_TTL) / URL_TTL) * URL_TTL
+    return f"{FILE_SERVER_URL}{path}?expires={expires}&sig={_signature(path, expires)}"
+
+
+def file_url(file_id):
+    return signed_url(f"/files/{file_id}")
+
+
+def export_url(export_format):
+    return signed_url(f"/exports/customers.{export_format}")
+
+
+def _http_date(value):
+    return formatdate(calendar.timegm(value.utctimetuple()), usegmt=True)
+
+
+def _parse_range(header, length):
+    match = RANGE_HEADER.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        start, end = max(length - int(end), 0), length - 1
+    else:
+        start, end = int(start), min(int(end) if end else length - 1, length - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class GridFSRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _authorized(self, path, query):
+        try:
+            expires = int(query["expires"][0])
+            signature = query["sig"][0]
+        except (KeyError, ValueError):
+            return False
+        return expires >= time.time() and hmac.compare_digest(signature, _signature(path, expires))
+
+    def _not_modified(self, etag, upload_date):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return calendar.timegm(upload_date.utctimetuple()) <= since.timestamp()
+        return False
+
+    def _serve(self, send_body):
+        url = urlsplit(self.path)
+        if url.path == METRICS_PATH:
+            self._metrics(send_body)
+            return
+        if not self._authorized(url.path, parse_qs(url.query)):
+            self.send_error(403)
+            return
+        export = EXPORT_PATH.match(url.path)
+        if export:
+            self._export(export.group(1), send_body)
+            return
+        match = FILE_PATH.match(url.path)
+        if not match:
+            self.send_error(404)
+            return
+        file_id = match.group(1)
+        try:
+            grid_out = get_fs().get(ObjectId(file_id))
+        except NoFile:
+            self.send_error(404)
+            return
+
+        etag = f'"{file_id}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": _http_date(grid_out.upload_date),
+            "Cache-Control": f"private, max-age={URL_TTL}",
+            "Accept-Ranges": "bytes",
+        }
+        if self._not_modified(etag, grid_out.upload_date):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        length = grid_out.length
+        status, start, end = 200, 0, length - 1
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range", etag) in (etag, headers["Last-Modified"]):
+            try:
+                byte_range = _parse_range(range_header, length)
+            except ValueError:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{length}")
+                self.end_headers()
+                return
+            if byte_range:
+                status, (start, end) = 206, byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+
+        self.send_response(status)
+        headers["Content-Type"] = grid_out.content_type or "application/octet-stream"
+        headers["Content-Length"] = str(max(end - start + 1, 0))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if send_body:
+            self._stream(grid_out, start, end - start + 1)
+
+    def _stream(self, grid_out, start, remaining):
+        # Reads one GridFS chunk at a time, so memory use does not grow with file size
+        grid_out.seek(start)
+        try:
+            while remaining > 0:
+                data = grid_out.read(min(grid_out.chunk_size, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _export(self, export_format, send_body):
+        # No Content-Length: the body is written batch by batch as the cursor is read
+        # and the HTTP/1.0 connection closes at the end
+        self.send_response(200)
+        self.send_header("Content-Type", EXPORT_FORMATS[export_format])
+        self.send_header("Content-Disposition", f'attachment; filename="customers.{export_format}"')
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if not send_body:
+            return
+        try:
+            if export_format == "csv":
+                for data in stream_csv(get_database()):
+                    self.wfile.write(data)
+            else:
+                # Parquet writes its footer last, so it is spooled to disk and then streamed
+                with tempfile.TemporaryFile() as spool:
+                    write_parquet(get_database(), spool)
+                    spool.seek(0)
+                    for data in iter(lambda: spool.read(EXPORT_CHUNK_SIZE), b""):
+                        self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _metrics(self, send_body):
+        if METRICS_TOKEN and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+            self.send_error(401)
+            return
+        body = profiler.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_file_server(host=FILE_SERVER_HOST, port=FILE_SERVER_PORT):
+    # One server thread per process, shared by every Streamlit session
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), GridFSRequestHandler)
+            except OSError as exc:
+                print(f"File server could not listen on {host}:{port}: {exc}")
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="gridfs-file-server", daemon=True).start()
+    return _server
+
+
+if __name__ == "__main__":
+    # Standalone mode: set FILE_SERVER_SECRET to the same value as the app so its URLs verify
+    server = ThreadingHTTPServer((FILE_SERVER_HOST, FILE_SERVER_PORT), GridFSRequestHandler)
+    print(f"Serving GridFS files on {FILE_SERVER_HOST}:{FILE_SERVER_PORT}")
+    server.serve_forever()
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+
+# Email configuration (replace with your email server details, or set the SMTP_* variables)
+SMTP_SERVER = os.environ.get("SMTP_SERVER", 'smtp.your-email-provider.com')
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 587))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") == "1"
+SMTP_TIMEOUT = 30
+EMAIL_ADDRESS = os.environ.get("EMAIL_ADDRESS", 'your-email@example.com')
+EMAIL_PASSWORD = os.environ.get("EMAIL_PASSWORD", 'your-email-password')
+
+MAIL_COLLECTION = "mail_queue"
+MAIL_WORKERS = int(os.environ.get("MAIL_WORKERS", 2))
+MAIL_BATCH_SIZE = 20
+MAIL_MAX_ATTEMPTS = 6
+MAIL_RETRY_BASE = 30
+MAIL_POLL_INTERVAL = 5
+# A message left in "sending" this long belongs to a worker that died and is retried
+MAIL_STALE_AFTER = timedelta(minutes=10)
+# Sessions idle longer than this are checked with NOOP before reuse, and closed when the queue is empty
+SMTP_IDLE_CHECK = 60
+
+QUEUED, SENDING, SENT, FAILED = "queued", "sending", "sent", "failed"
+
+_workers = []
+_workers_lock = threading.Lock()
+_wake = threading.Event()
+
+
+class MailStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections = 0
+        self._recent = deque()
+
+    def record(self, outcome, count=1):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + count)
+            if outcome == "sent":
+                self._recent.append(time.monotonic())
+
+    def snapshot(self):
+        with self._lock:
+            cutoff = time.monotonic() - 60
+            while self._recent and self._recent[0] < cutoff:
+                self._recent.popleft()
+            return {
+                "sent": self.sent,
+                "retried": self.retried,
+                "failed": self.failed,
+                "smtp_connections_opened": self.connections,
+                "sent_last_minute": len(self._recent),
+            }
+
+
+stats = MailStats()
+
+
+class SMTPSession:
+    # One long-lived connection per worker thread, reopened only when the server drops it.
+    # smtplib (and ssl) are imported when the first message is sent, not at app start.
+    def __init__(self):
+        self.server = None
+        self.last_used = 0
+
+    def get(self):
+        import smtplib
+
+        if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_CHECK:
+            try:
+                self.server.noop()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self.server is None:
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT)
+            if SMTP_STARTTLS:
+                server.starttls()
+            if EMAIL_PASSWORD:
+                server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
+            stats.record("connections")
+            self.server = server
+        self.last_used = time.monotonic()
+        return self.server
+
+    def send(self, msg):
+        import smtplib
+
+        try:
+            self.get().send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.close()
+            self.get().send_message(msg)
+
+    def close_if_idle(self):
+        if self.server is not None and time.monotonic() - self.last_used > SMTP_IDLE_CHECK:
+            self.close()
+
+    def close(self):
+        import smtplib
+
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.server = None
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def enqueue_email(db, to_email, subject, message):
+    now = _now()
+    result = db[MAIL_COLLECTION].insert_one({
+        "to": to_email,
+        "subject": subject,
+        "message": message,
+        "status": QUEUED,
+        "attempts": 0,
+        "created_at": now,
+        "next_attempt_at": now,
+    })
+    _wake.set()
+    return result.inserted_id
+
+
+def _fail_stale(db, now):
+    # A message whose worker died on its last attempt is not retried again
+    result = db[MAIL_COLLECTION].update_many(
+        {"status": SENDING, "locked_at": {"$lt": now - MAIL_STALE_AFTER}, "attempts": {"$gte": MAIL_MAX_ATTEMPTS}},
+        {"$set": {"status": FAILED, "last_error": "Worker stopped while sending"}, "$unset": {"locked_at": ""}},
+    )
+    if result.modified_count:
+        stats.record("failed", result.modified_count)
+
+
+def _claim_batch(db):
+    now = _now()
+    _fail_stale(db, now)
+    batch = []
+    for _ in range(MAIL_BATCH_SIZE):
+        mail = db[MAIL_COLLECTION].find_one_and_update(
+            {"$or": [
+                {"status": QUEUED, "next_attempt_at": {"$lte": now}},
+                {"status": SENDING, "locked_at": {"$lt": now - MAIL_STALE_AFTER}, "attempts": {"$lt": MAIL_MAX_ATTEMPTS}},
+            ]},
+            {"$set": {"status": SENDING, "locked_at": now}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if mail is None:
+            break
+        batch.append(mail)
+    return batch
+
+
+def _message(mail):
+    from email.mime.text import MIMEText
+
+    msg = MIMEText(mail["message"])
+    msg['Subject'] = mail["subject"]
+    msg['From'] = EMAIL_ADDRESS
+    msg['To'] = mail["to"]
+    return msg
+
+
+def _outcome(mail, error):
+    if error is None:
+        stats.record("sent")
+        return UpdateOne({"_id": mail["_id"]}, {"$set": {"status": SENT, "sent_at": _now()}, "$unset": {"locked_at": ""}})
+    if mail["attempts"] >= MAIL_MAX_ATTEMPTS:
+        stats.record("failed")
+        return UpdateOne({"_id": mail["_id"]}, {"$set": {"status": FAILED, "last_error": str(error)}, "$unset": {"locked_at": ""}})
+    stats.record("retried")
+    retry_at = _now() + timedelta(seconds=MAIL_RETRY_BASE * 2 ** (mail["attempts"] - 1))
+    return UpdateOne(
+        {"_id": mail["_id"]},
+        {"$set": {"status": QUEUED, "next_attempt_at": retry_at, "last_error": str(error)}, "$unset": {"locked_at": ""}},
+    )
+
+
+def _send_batch(db, session, batch):
+    results = []
+    for mail in batch:
+        # Any error, not only SMTP ones, is recorded against this message so one bad
+        # message cannot stop the worker or strand the rest of the batch
+        try:
+            session.send(_message(mail))
+            results.append(_outcome(mail, None))
+        except Exception as exc:
+            session.close()
+            results.append(_outcome(mail, exc))
+    try:
+        db[MAIL_COLLECTION].bulk_write(results, ordered=False)
+    except Exception as exc:
+        # The batch stays in "sending" and is reclaimed once it goes stale
+        print(f"Mail queue update failed: {exc}")
+
+
+def _work(db):
+    session = SMTPSession()
+    while True:
+        try:
+            batch = _claim_batch(db)
+        except Exception as exc:
+            print(f"Mail queue unavailable: {exc}")
+            batch = []
+        if not batch:
+            session.close_if_idle()
+            _wake.wait(MAIL_POLL_INTERVAL)
+            _wake.clear()
+            continue
+        _send_batch(db, session, batch)
+
+
+def start_mail_workers(db, workers=MAIL_WORKERS):
+    with _workers_lock:
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        for number in range(len(_workers), workers):
+            worker = threading.Thread(target=_work, args=(db,), name=f"mail-worker-{number}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+    return _workers
+
+
+def queue_stats(db):
+    depth = {status: db[MAIL_COLLECTION].count_documents({"status": status}) for status in (QUEUED, SENDING, SENT, FAILED)}
+    return {"queue": depth, "workers": len(_workers), **stats.snapshot()}
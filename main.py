@@ -1,96 +1,633 @@
 import streamlit as st
-from pymongo import MongoClient
-import gridfs
-from PIL import Image
-import io
-import smtplib
-from email.mime.text import MIMEText
 import base64
-import pandas as pd
-import plotly.express as px
+import uuid
+from datetime import datetime, timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from analytics import ANALYSIS_COLUMNS, ANALYSIS_MAX_GROUPS, chart_series, invalidate_analytics
+from blobs import DOCUMENT_FIELDS, release_files, replaced_files, start_sweeper
+from bulk_io import import_customers
+from db import get_database, get_fs, pool_stats
+from file_server import FILE_SERVER_URL, METRICS_PATH, export_url, file_url, start_file_server
+from mail_queue import enqueue_email, queue_stats, start_mail_workers
+from migrations import MigrationError, check_indexes
+from profiler import SLOW_QUERY_MS, begin_rerun, profiler
+from queries import reset_request_filter, user_search_filter
+from read_cache import read_cache
+from rollups import ROLLUP_FIELDS, ROLLUP_PROJECTION, apply_rollup_deltas, get_rollups, reconcile, start_reconciler
+from thumbnails import find_file_and_derivatives, schedule_derivatives
+from uploads import UploadError, upload_files
+from validation import ENTITY_TYPES, FILE_TYPES, FORM_DEFAULTS, LOCATIONS, PRODUCTS, REQUIRED_DOCUMENTS, TYPES, is_phone_number
+from versioning import CustomerDeleted, VersionConflict, changed_fields, version_filter
 
 st.set_page_config(
     page_title="Fintree Financial Services",
     page_icon="🌳",
 )
-# MongoDB connection details
-mongo_uri = "mongodb://localhost:27017"
-database_name = "Fintree_Finance"
+# MongoDB connection: one pooled client per process, shared by every session
 collection_name = "customer"
-client = MongoClient(mongo_uri)
-db = client[database_name]
+try:
+    db = get_database()
+except MigrationError as error:
+    st.error(f"The database could not be migrated: {error}")
+    st.stop()
 collection = db[collection_name]
-fs = gridfs.GridFS(db)
+reset_requests = db["password_reset_requests"]
+fs = get_fs()
+start_reconciler(db)
+start_sweeper(db, fs)
+# None when the port could not be bound; display_file then sends files inline
+file_server = start_file_server()
+start_mail_workers(db)
 
-# Email configuration (replace with your email server details)
-SMTP_SERVER = 'smtp.your-email-provider.com'
-SMTP_PORT = 587
-EMAIL_ADDRESS = 'your-email@example.com'
-EMAIL_PASSWORD = 'your-email-password'
+# Fields the write helpers read back to maintain rollups and GridFS references
+CHANGE_PROJECTION = {**ROLLUP_PROJECTION, **{field: 1 for field in DOCUMENT_FIELDS}}
 
 # Helper functions
+# Customer documents are cached for the current rerun and, for READ_CACHE_TTL
+# seconds, in the process-wide read_cache shared by all sessions; every write
+# helper invalidates them
+def rerun_scope():
+    # Per-session dict, emptied by main() at the start of every rerun
+    if not st.runtime.exists():
+        return None
+    return st.session_state.setdefault("rerun_reads", {})
+
+def invalidate_customer(username):
+    read_cache.invalidate(("customer", username), scope=rerun_scope())
+
 def user_exists(username, password):
     user = collection.find_one({"username": username, "password": password})
     return user is not None
 
 def register_user(username, password, contact):
-    collection.insert_one({"username": username, "password": password, "contact": contact})
+    collection.insert_one({"username": username, "password": password, "contact": contact, "version": 0})
+    apply_rollup_deltas(db, None, {"username": username})
+    invalidate_customer(username)
+    invalidate_analytics()
 
 def reset_password(username, new_password):
     collection.update_one({"username": username}, {"$set": {"password": new_password}})
+    invalidate_customer(username)
 
 def add_customer_detail(details):
-    collection.update_one({"username": details["username"]}, {"$set": details}, upsert=True)
+    before = collection.find_one_and_update({"username": details["username"]}, {"$set": details, "$inc": {"version": 1}}, projection=CHANGE_PROJECTION, upsert=True, return_document=ReturnDocument.BEFORE)
+    apply_rollup_deltas(db, before, {**(before or {}), **details})
+    release_files(db, fs, replaced_files(before, details))
+    invalidate_customer(details["username"])
+    invalidate_analytics()
 
 def get_customer_detail(username):
-    return collection.find_one({"username": username})
-
-def update_customer_detail(username, updated_details):
-    collection.update_one({"username": username}, {"$set": updated_details})
+    return read_cache.get(("customer", username), lambda: collection.find_one({"username": username}), rerun_scope())
+
+# Pass the version the edit was based on to reject it if someone else saved in between
+def update_customer_detail(username, updated_details, version=None):
+    if not updated_details:
+        return False
+    query = {"username": username}
+    if version is not None:
+        query.update(version_filter(version))
+    before = collection.find_one_and_update(query, {"$set": updated_details, "$inc": {"version": 1}}, projection=CHANGE_PROJECTION, return_document=ReturnDocument.BEFORE)
+    invalidate_customer(username)
+    if not before:
+        if version is not None and collection.count_documents({"username": username}, limit=1):
+            raise VersionConflict(f"{username} was changed by someone else since it was loaded. Reload and apply your changes again.")
+        return False
+    apply_rollup_deltas(db, before, {**before, **updated_details})
+    release_files(db, fs, replaced_files(before, updated_details))
+    invalidate_analytics()
+    return True
 
 def delete_user(username):
-    collection.delete_one({"username": username})
-
-def get_all_users():
-    return collection.find({"username": {"$ne": "finadmin"}})
+    before = collection.find_one_and_delete({"username": username}, projection=CHANGE_PROJECTION)
+    apply_rollup_deltas(db, before, None)
+    release_files(db, fs, replaced_files(before, None))
+    reset_requests.delete_many({"username": username})
+    invalidate_customer(username)
+    invalidate_analytics()
+
+def save_details_with_uploads(uploads, details, save):
+    # Uploads run concurrently; the customer document only changes once all of them are stored
+    if not details and not any(uploads.values()):
+        return False
+    file_ids = upload_files(db, fs, uploads)
+    try:
+        saved = save({**details, **file_ids})
+    except Exception:
+        release_files(db, fs, file_ids.values())
+        raise
+    # update_customer_detail returns False when the customer no longer exists
+    if saved is False:
+        release_files(db, fs, file_ids.values())
+        raise CustomerDeleted("This customer was deleted since it was loaded.")
+    for file_id in file_ids.values():
+        schedule_derivatives(file_id)
+    return True
+
+# The document an edit form was opened with, kept while the form stays on screen
+# until it is saved, so the update is diffed and version-checked against what the
+# user actually saw
+def form_snapshot(form_key, details):
+    st.session_state.setdefault("rerun_forms", set()).add(form_key)
+    snapshots = st.session_state.setdefault("form_snapshots", {})
+    snapshot = snapshots.get(form_key)
+    if snapshot is None or snapshot.get("username") != details.get("username"):
+        snapshot = snapshots[form_key] = details
+    return snapshot
+
+def drop_form_snapshot(form_key):
+    st.session_state.setdefault("form_snapshots", {}).pop(form_key, None)
+
+# Called at the end of main(): a form that was not rendered this rerun reopens on
+# the current document, as Streamlit also drops its widgets' state
+def drop_unrendered_snapshots():
+    snapshots = st.session_state.setdefault("form_snapshots", {})
+    for form_key in set(snapshots) - st.session_state.get("rerun_forms", set()):
+        del snapshots[form_key]
+
+USER_PAGE_SIZE = 20
+
+def search_users(query="", after=None, limit=USER_PAGE_SIZE):
+    cursor = collection.find(user_search_filter(query, after), {"_id": 0, "username": 1, "name": 1}).sort("username", 1).limit(limit + 1)
+    users = list(cursor)
+    return users[:limit], len(users) > limit
+
+# Password reset requests live in their own collection, one pending request per
+# user; resolved and stale requests expire through a TTL index on created_at.
+# Pages are read straight from the status_id index, not through read_cache.
+RESET_REQUEST_PAGE_SIZE = 20
 
 def add_password_reset_request(username, contact):
-    collection.update_one({"username": username}, {"$set": {"password_reset_request": True, "reset_contact": contact}})
-
-def get_password_reset_requests():
-    return collection.find({"password_reset_request": True})
-
-def delete_password_reset_request(username):
-    collection.update_one({"username": username}, {"$unset": {"password_reset_request": "", "reset_contact": ""}})
-
+    try:
+        reset_requests.update_one(
+            {"username": username, "status": "pending"},
+            {"$set": {"contact": contact}, "$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # A concurrent submit inserted the pending request first (username_pending_unique)
+        pass
+
+def get_password_reset_requests(after=None, limit=RESET_REQUEST_PAGE_SIZE):
+    requests = list(reset_requests.find(reset_request_filter(after), {"username": 1, "contact": 1, "created_at": 1}).sort("_id", 1).limit(limit + 1))
+    return requests[:limit], len(requests) > limit
+
+def resolve_password_reset_requests(request_ids):
+    if not request_ids:
+        return 0
+    resolved_at = datetime.now(timezone.utc)
+    result = reset_requests.bulk_write(
+        [UpdateOne({"_id": request_id, "status": "pending"}, {"$set": {"status": "resolved", "resolved_at": resolved_at}}) for request_id in request_ids],
+        ordered=False,
+    )
+    return result.modified_count
+
+# Queued for the background mail workers (mail_queue.py); returns without waiting for SMTP
 def send_email(to_email, subject, message):
-    msg = MIMEText(message)
-    msg['Subject'] = subject
-    msg['From'] = EMAIL_ADDRESS
-    msg['To'] = to_email
-
-    with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-        server.starttls()
-        server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-        server.sendmail(EMAIL_ADDRESS, to_email, msg.as_string())
-
-# Function to display image or PDF
+    return enqueue_email(db, to_email, subject, message)
+
+# Searchable user picker, one page of usernames per query (keyset pagination on username)
+def user_picker(label, key):
+    query = st.text_input("Search by username, name, contact or mobile", key=f"{key}_search").strip()
+    pages_key = f"{key}_pages"
+    if st.session_state.get(f"{key}_last_search") != query or pages_key not in st.session_state:
+        st.session_state[pages_key] = [None]
+        st.session_state[f"{key}_last_search"] = query
+    pages = st.session_state[pages_key]
+
+    users, has_more = search_users(query, pages[-1])
+    names = {user["username"]: user.get("name") for user in users}
+    selected_user = st.selectbox(
+        label,
+        list(names),
+        format_func=lambda username: f"{username} ({names[username]})" if names.get(username) else username,
+        key=key,
+    )
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("Previous page", key=f"{key}_prev", disabled=len(pages) == 1):
+        pages.pop()
+        st.experimental_rerun()
+    if next_col.button("Next page", key=f"{key}_next", disabled=not has_more):
+        pages.append(users[-1]["username"])
+        st.experimental_rerun()
+    return selected_user
+
+def file_source(file_id):
+    # The file server URL, or the file's bytes if the server is not running
+    return file_url(file_id) if file_server is not None else fs.get(file_id).read()
+
+# Function to display image or PDF. Shows the downscaled thumbnail or first-page
+# preview when one exists; the original is only fetched if the user opens it.
+# Files are served by the GridFS file server, not through the Streamlit websocket.
 def display_file(file_id):
     if file_id:
-        file_data = fs.get(file_id).read()
-        file_type = fs.get(file_id).content_type
-
-        if file_type and "image" in file_type:
-            image = Image.open(io.BytesIO(file_data))
-            st.image(image)
+        original, derivatives = find_file_and_derivatives(db, file_id)
+        file_type = original.get("contentType") if original else None
+        derivative = derivatives.get("thumbnail") or derivatives.get("preview")
+
+        if derivative:
+            st.image(file_source(derivative["_id"]))
+            if file_server is not None:
+                st.markdown(f"[Open original]({file_url(file_id)})")
+        elif file_type and "image" in file_type:
+            schedule_derivatives(file_id)
+            st.image(file_source(file_id))
         elif file_type and "pdf" in file_type:
-            pdf_display = f'<iframe src="data:application/pdf;base64,{base64.b64encode(file_data).decode()}" width="700" height="900" type="application/pdf"></iframe>'
+            schedule_derivatives(file_id)
+            source = file_source(file_id)
+            if isinstance(source, bytes):
+                source = f"data:application/pdf;base64,{base64.b64encode(source).decode()}"
+            pdf_display = f'<iframe src="{source}" width="700" height="900" type="application/pdf"></iframe>'
             st.markdown(pdf_display, unsafe_allow_html=True)
         else:
             st.write("Unsupported file type.")
     else:
         st.write("No file uploaded.")
 
+# Logout button shown under every panel
+def logout_button(key):
+    st.markdown('<div class="logout-button">', unsafe_allow_html=True)
+    if st.button("Logout", key=key):
+        st.session_state.logged_in = False
+        st.session_state.username = ""
+        st.session_state.is_admin = False
+        st.session_state.new_user = False
+        st.session_state.pop("form_snapshots", None)
+        st.experimental_rerun()
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Admin panel sections
+def admin_view_users():
+    st.subheader("View All Users")
+    selected_user = user_picker("Select User to view details", "view_user")
+
+    if selected_user:
+        user_details = get_customer_detail(selected_user)
+        if user_details:
+            st.write("Username:", user_details.get("username", "N/A"))
+            st.write("Contact:", user_details.get("contact", "N/A"))
+            st.write("Email:", user_details.get("email", "N/A"))
+            st.write("Product:", user_details.get("product", "N/A"))
+            st.write("Type:", user_details.get("type", "N/A"))
+            st.write("Location:", user_details.get("location", "N/A"))
+            st.write("Name:", user_details.get("name", "N/A"))
+            st.write("Type of Entity:", user_details.get("type_of_entity", "N/A"))
+            st.write("Contact Person:", user_details.get("contact_person", "N/A"))
+            st.write("Mobile 1:", user_details.get("mobile_1", "N/A"))
+            st.write("Mobile 2:", user_details.get("mobile_2", "N/A"))
+            for key in DOCUMENT_FIELDS:
+                if key in user_details:
+                    display_file(user_details[key])
+
+def admin_edit_user():
+    st.subheader("Edit User Details")
+    selected_user = user_picker("Select User to edit details", "edit_user")
+
+    if selected_user:
+        user_details = get_customer_detail(selected_user)
+        if user_details:
+            user_details = form_snapshot("edit_user", user_details)
+            username = user_details.get("username", "")
+            contact = st.text_input("Contact", user_details.get("contact", ""))
+            email = st.text_input("Email", user_details.get("email", ""))
+            product = st.selectbox("Product", PRODUCTS, index=PRODUCTS.index(user_details.get("product", FORM_DEFAULTS["product"])), key="edit_product")
+            type_ = st.selectbox("Type", TYPES, index=TYPES.index(user_details.get("type", FORM_DEFAULTS["type"])), key="edit_type")
+            location = st.selectbox("Location", LOCATIONS, index=LOCATIONS.index(user_details.get("location", FORM_DEFAULTS["location"])), key="edit_location")
+            name = st.text_input("Name", value=user_details.get("name", ""), key="edit_name")
+            type_of_entity = st.selectbox("Type of Entity", ENTITY_TYPES, index=ENTITY_TYPES.index(user_details.get("type_of_entity", FORM_DEFAULTS["type_of_entity"])), key="edit_type_of_entity")
+            contact_person = st.text_input("Contact Person", value=user_details.get("contact_person", ""), key="edit_contact_person")
+            mobile_1 = st.text_input("Mobile 1", value=user_details.get("mobile_1", ""), key="edit_mobile_1")
+            mobile_2 = st.text_input("Mobile 2", value=user_details.get("mobile_2", ""), key="edit_mobile_2")
+
+            uploads = {
+                "Signed Agreement": st.file_uploader("Signed Agreement (Compulsory)", type=FILE_TYPES, key="edit_signed_agreement"),
+                "PAN": st.file_uploader("PAN (Compulsory)", type=FILE_TYPES, key="edit_pan"),
+                "Cancelled Cheque": st.file_uploader("Cancelled Cheque (Compulsory)", type=FILE_TYPES, key="edit_cancelled_cheque"),
+                "GST": st.file_uploader("GST (Optional)", type=FILE_TYPES, key="edit_gst"),
+                "Shop Establishment Certificate": st.file_uploader("Shop Establishment Certificate (Optional)", type=FILE_TYPES, key="edit_shop_establishment"),
+                "Partnership Deed": st.file_uploader("Partnership Deed (Optional)", type=FILE_TYPES, key="edit_partnership_deed"),
+                "Certificate of Incorporation": st.file_uploader("Certificate of Incorporation (Optional)", type=FILE_TYPES, key="edit_certificate_of_incorporation"),
+            }
+
+            if st.button("Update User"):
+                updated_details = {
+                    "contact": contact,
+                    "email": email,
+                    "product": product,
+                    "type": type_,
+                    "location": location,
+                    "name": name,
+                    "type_of_entity": type_of_entity,
+                    "contact_person": contact_person,
+                    "mobile_1": mobile_1,
+                    "mobile_2": mobile_2
+                }
+                changes = changed_fields(user_details, updated_details)
+                try:
+                    saved = save_details_with_uploads(uploads, changes, lambda details: update_customer_detail(username, details, user_details.get("version", 0)))
+                except (UploadError, VersionConflict) as exc:
+                    drop_form_snapshot("edit_user")
+                    st.error(str(exc))
+                else:
+                    drop_form_snapshot("edit_user")
+                    if saved:
+                        st.success("User details updated successfully!")
+                    else:
+                        st.info("No changes to save.")
+
+def admin_delete_user():
+    st.subheader("Delete User")
+    selected_user = user_picker("Select User to delete", "delete_user")
+
+    if selected_user:
+        if st.button("Delete User"):
+            delete_user(selected_user)
+            st.success("User deleted successfully!")
+
+def admin_password_requests():
+    import pandas as pd
+
+    st.subheader("Request for Password")
+    pages = st.session_state.setdefault("reset_request_pages", [None])
+    requests, has_more = get_password_reset_requests(pages[-1])
+    if requests:
+        df_requests = pd.DataFrame(requests, columns=["username", "contact", "created_at"])
+        st.write(df_requests)
+        labels = {request["_id"]: request["username"] for request in requests}
+        selected = st.multiselect("Select requests to resolve", list(labels), format_func=labels.get, key="resolve_requests")
+        resolve_col, resolve_all_col = st.columns(2)
+        if resolve_col.button("Resolve selected", disabled=not selected):
+            resolve_password_reset_requests(selected)
+            st.experimental_rerun()
+        if resolve_all_col.button("Resolve all on this page"):
+            resolve_password_reset_requests(list(labels))
+            st.experimental_rerun()
+    else:
+        st.write("No password reset requests found.")
+
+    prev_col, next_col = st.columns(2)
+    if prev_col.button("Previous page", key="reset_requests_prev", disabled=len(pages) == 1):
+        pages.pop()
+        st.experimental_rerun()
+    if next_col.button("Next page", key="reset_requests_next", disabled=not has_more):
+        pages.append(requests[-1]["_id"])
+        st.experimental_rerun()
+
+def admin_analysis():
+    import pandas as pd
+    import plotly.express as px
+
+    st.subheader("Analysis")
+    # Counts come from the rollup collection; ad-hoc charts are grouped in MongoDB
+    rollups = get_rollups(db)
+    if rollups["total"]:
+        st.write(f"Total number of users: {rollups['total']}")
+
+        breakdown_field = st.selectbox("Breakdown by", ROLLUP_FIELDS, key="breakdown_field")
+        breakdown = pd.DataFrame(list(rollups[breakdown_field].items()), columns=[breakdown_field, "count"])
+        st.plotly_chart(px.bar(breakdown, x=breakdown_field, y="count"))
+
+        selected_columns = st.multiselect("Select columns for analysis", ANALYSIS_COLUMNS, placeholder="Select columns")
+        chart_type = st.selectbox("Select chart type", ["Bar", "Line", "Scatter", "Histogram", "Pie"], placeholder="Select chart type")
+
+        if selected_columns:
+            series = chart_series(tuple(selected_columns), chart_type)
+            df = pd.DataFrame(series["rows"], columns=series["fields"] + ["count"]).fillna("N/A")
+            x = series["fields"][0]
+            color = series["fields"][1] if len(series["fields"]) > 1 else None
+            if chart_type == "Bar":
+                fig = px.bar(df, x=x, y="count", color=color)
+            elif chart_type == "Line":
+                fig = px.line(df, x=x, y="count", color=color)
+            elif chart_type == "Scatter":
+                fig = px.scatter(df, x=x, y=color or "count", size="count")
+            elif chart_type == "Histogram":
+                fig = px.bar(df, x=x, y="count")
+            elif chart_type == "Pie":
+                fig = px.pie(df, names=x, values="count")
+
+            st.plotly_chart(fig)
+            if series["truncated"]:
+                st.write(f"Showing the {ANALYSIS_MAX_GROUPS} largest groups only.")
+        else:
+            st.write("Please select columns for analysis")
+
+def admin_import_export():
+    import pandas as pd
+
+    st.subheader("Import / Export")
+    st.write("Import customers from a CSV or Excel file with a header row. Columns: username (required), mobile_1 and mobile_2 (required, 10 digits), password, contact, email, product, type, location, name, type_of_entity, contact_person. Existing usernames are updated.")
+    import_file = st.file_uploader("Customer file", type=["csv", "xlsx"], key="import_file")
+    if import_file and st.button("Import", key="import_submit"):
+        progress_bar = st.progress(0.0)
+        status = st.empty()
+
+        def show_progress(fraction, rows):
+            progress_bar.progress(fraction)
+            status.write(f"{rows} rows processed")
+
+        # Bulk writes bypass the per-customer helpers, so derived data is rebuilt once,
+        # even when a batch failed after others were written
+        try:
+            report = import_customers(db, import_file, import_file.name, size=import_file.size, progress=show_progress)
+        finally:
+            reconcile(db)
+            invalidate_analytics()
+            read_cache.clear()
+        st.success(f"Imported {report['inserted']} new and updated {report['updated']} existing customers from {report['rows']} rows.")
+        if report["errors"]:
+            st.error(f"{len(report['errors'])} rows were not imported.")
+            st.write(pd.DataFrame([{"row": error["row"], "errors": "; ".join(error["errors"])} for error in report["errors"]]))
+
+    st.write("Export all customers (streamed from the database in batches):")
+    if file_server is None:
+        st.error("Exports are served by the file server, which could not start. Check FILE_SERVER_HOST and FILE_SERVER_PORT.")
+    else:
+        st.markdown(f"[Download CSV]({export_url('csv')}) | [Download Parquet]({export_url('parquet')})")
+
+def admin_system():
+    st.subheader("System")
+    if file_server is None:
+        st.error("The file server could not listen on FILE_SERVER_HOST:FILE_SERVER_PORT, so documents are sent inline and exports and /metrics are unavailable.")
+    else:
+        st.write(f"File server listening on {file_server.server_address[0]}:{file_server.server_address[1]}, reached by browsers at {FILE_SERVER_URL}")
+    # Checked on every visit, so an index dropped after startup shows up here
+    missing = check_indexes(db)
+    if missing:
+        st.warning(f"Missing database indexes: {missing}")
+    st.write("Database connection pool")
+    st.json(pool_stats())
+    st.write("Mail queue")
+    st.json(queue_stats(db))
+    st.write("Read cache")
+    st.json(read_cache.stats())
+
+def admin_profiler():
+    import pandas as pd
+
+    st.subheader("Query Profiler")
+    if not profiler.enabled:
+        st.write("Command profiling is off. Set MONGO_PROFILE_COMMANDS=1 (or profile_commands in the [mongo] secrets) and restart the app to record queries.")
+        return
+    # Every MongoDB command is attributed to the rerun and helper that sent it;
+    # the current rerun is still running, so the tables start from the previous one
+    session = st.session_state.profile_session
+    reruns = profiler.reruns(session)[1:]
+    st.write("Reruns of this session")
+    if reruns:
+        st.dataframe(pd.DataFrame(reruns).drop(columns=["session"]))
+    else:
+        st.write("No earlier reruns recorded yet.")
+    st.write("Reruns of all sessions")
+    st.dataframe(pd.DataFrame(profiler.reruns()[:50]))
+    st.write(f"Slow queries (at least {SLOW_QUERY_MS:g} ms, or failed)")
+    slow = profiler.slow_queries()
+    if slow:
+        slow_df = pd.DataFrame(slow)
+        slow_df["time"] = pd.to_datetime(slow_df["time"], unit="s")
+        st.dataframe(slow_df)
+    else:
+        st.write("No slow queries recorded.")
+    st.write("Top call sites by total time")
+    st.dataframe(pd.DataFrame(profiler.top_call_sites()))
+    st.write(f"Prometheus metrics: {FILE_SERVER_URL}{METRICS_PATH}")
+    if st.button("Reset profiler", key="reset_profiler"):
+        profiler.reset()
+        st.experimental_rerun()
+
+ADMIN_SECTIONS = {
+    "View All Users": admin_view_users,
+    "Edit User Details": admin_edit_user,
+    "Delete User": admin_delete_user,
+    "Request for Password": admin_password_requests,
+    "Analysis": admin_analysis,
+    "Import / Export": admin_import_export,
+    "System": admin_system,
+    "Query Profiler": admin_profiler,
+}
+
+# Customer panel sections, each given the customer's document (None before Add Details)
+def customer_add_details(details):
+    st.subheader("Add Details")
+    product = st.selectbox("Product", PRODUCTS, key="add_product")
+    type_ = st.selectbox("Type", TYPES, key="add_type")
+    location = st.selectbox("Location", LOCATIONS, key="add_location")
+    name = st.text_input("Name", key="add_name")
+    type_of_entity = st.selectbox("Type of Entity", ENTITY_TYPES, key="add_type_of_entity")
+    contact_person = st.text_input("Contact Person", key="add_contact_person")
+    mobile_1 = st.text_input("Mobile 1", key="add_mobile_1")
+    mobile_2 = st.text_input("Mobile 2", key="add_mobile_2")
+
+    uploads = {
+        "Signed Agreement": st.file_uploader("Signed Agreement (Compulsory)", type=FILE_TYPES, key="add_signed_agreement"),
+        "PAN": st.file_uploader("PAN (Compulsory)", type=FILE_TYPES, key="add_pan"),
+        "Cancelled Cheque": st.file_uploader("Cancelled Cheque (Compulsory)", type=FILE_TYPES, key="add_cancelled_cheque"),
+        "GST": st.file_uploader("GST (Optional)", type=FILE_TYPES, key="add_gst"),
+        "Shop Establishment Certificate": st.file_uploader("Shop Establishment Certificate (Optional)", type=FILE_TYPES, key="add_shop_establishment"),
+        "Partnership Deed": st.file_uploader("Partnership Deed (Optional)", type=FILE_TYPES, key="add_partnership_deed"),
+        "Certificate of Incorporation": st.file_uploader("Certificate of Incorporation (Optional)", type=FILE_TYPES, key="add_certificate_of_incorporation"),
+    }
+
+    if st.button("Submit", key="add_submit"):
+        if not (is_phone_number(mobile_1) and is_phone_number(mobile_2)):
+            st.error("Both mobile numbers must be 10-digit numerical values.")
+        elif not all(uploads[key] for key in REQUIRED_DOCUMENTS):
+            st.error("Signed Agreement, PAN, and Cancelled Cheque are compulsory.")
+        else:
+            details = {
+                "username": st.session_state.username,
+                "product": product,
+                "type": type_,
+                "location": location,
+                "name": name,
+                "type_of_entity": type_of_entity,
+                "contact_person": contact_person,
+                "mobile_1": mobile_1,
+                "mobile_2": mobile_2,
+            }
+            try:
+                save_details_with_uploads(uploads, details, add_customer_detail)
+            except UploadError as exc:
+                st.error(str(exc))
+            else:
+                st.success("Details submitted successfully!")
+                st.experimental_rerun()
+
+def customer_view_details(details):
+    st.subheader("View Details")
+    if details:
+        st.write("Product:", details.get("product", "N/A"))
+        st.write("Type:", details.get("type", "N/A"))
+        st.write("Location:", details.get("location", "N/A"))
+        st.write("Name:", details.get("name", "N/A"))
+        st.write("Type of Entity:", details.get("type_of_entity", "N/A"))
+        st.write("Contact Person:", details.get("contact_person", "N/A"))
+        st.write("Mobile 1:", details.get("mobile_1", "N/A"))
+        st.write("Mobile 2:", details.get("mobile_2", "N/A"))
+        for key in DOCUMENT_FIELDS:
+            if key in details:
+                display_file(details[key])
+    else:
+        st.write("No details found.")
+
+def customer_update_details(details):
+    st.subheader("Update Details")
+    if details:
+        details = form_snapshot("update_details", details)
+        product = st.selectbox("Product", PRODUCTS, index=PRODUCTS.index(details.get("product", FORM_DEFAULTS["product"])), key="update_product")
+        type_ = st.selectbox("Type", TYPES, index=TYPES.index(details.get("type", FORM_DEFAULTS["type"])), key="update_type")
+        location = st.selectbox("Location", LOCATIONS, index=LOCATIONS.index(details.get("location", FORM_DEFAULTS["location"])), key="update_location")
+        name = st.text_input("Name", value=details.get("name", ""), key="update_name")
+        type_of_entity = st.selectbox("Type of Entity", ENTITY_TYPES, index=ENTITY_TYPES.index(details.get("type_of_entity", FORM_DEFAULTS["type_of_entity"])), key="update_type_of_entity")
+        contact_person = st.text_input("Contact Person", value=details.get("contact_person", ""), key="update_contact_person")
+        mobile_1 = st.text_input("Mobile 1", value=details.get("mobile_1", ""), key="update_mobile_1")
+        mobile_2 = st.text_input("Mobile 2", value=details.get("mobile_2", ""), key="update_mobile_2")
+
+        uploads = {
+            "Signed Agreement": st.file_uploader("Signed Agreement (Compulsory)", type=FILE_TYPES, key="update_signed_agreement"),
+            "PAN": st.file_uploader("PAN (Compulsory)", type=FILE_TYPES, key="update_pan"),
+            "Cancelled Cheque": st.file_uploader("Cancelled Cheque (Compulsory)", type=FILE_TYPES, key="update_cancelled_cheque"),
+            "GST": st.file_uploader("GST (Optional)", type=FILE_TYPES, key="update_gst"),
+            "Shop Establishment Certificate": st.file_uploader("Shop Establishment Certificate (Optional)", type=FILE_TYPES, key="update_shop_establishment"),
+            "Partnership Deed": st.file_uploader("Partnership Deed (Optional)", type=FILE_TYPES, key="update_partnership_deed"),
+            "Certificate of Incorporation": st.file_uploader("Certificate of Incorporation (Optional)", type=FILE_TYPES, key="update_certificate_of_incorporation"),
+        }
+
+        if st.button("Update", key="update_submit"):
+            if not (is_phone_number(mobile_1) and is_phone_number(mobile_2)):
+                st.error("Both mobile numbers must be 10-digit numerical values.")
+            else:
+                updated_details = {
+                    "product": product,
+                    "type": type_,
+                    "location": location,
+                    "name": name,
+                    "type_of_entity": type_of_entity,
+                    "contact_person": contact_person,
+                    "mobile_1": mobile_1,
+                    "mobile_2": mobile_2,
+                }
+                changes = changed_fields(details, updated_details)
+                try:
+                    saved = save_details_with_uploads(uploads, changes, lambda fields: update_customer_detail(st.session_state.username, fields, details.get("version", 0)))
+                except (UploadError, VersionConflict) as exc:
+                    drop_form_snapshot("update_details")
+                    st.error(str(exc))
+                else:
+                    drop_form_snapshot("update_details")
+                    if saved:
+                        st.success("Your details have been updated successfully!")
+                        st.experimental_rerun()
+                    else:
+                        st.info("No changes to save.")
+
+CUSTOMER_SECTIONS = {
+    "Add Details": customer_add_details,
+    "View Details": customer_view_details,
+    "Update Details": customer_update_details,
+}
+
 # Main interface
 def main():
     if 'logged_in' not in st.session_state:
@@ -98,318 +635,37 @@ def main():
         st.session_state.username = ""
         st.session_state.is_admin = False
         st.session_state.new_user = False  # Track if the user is newly registered
+    st.session_state.rerun_reads = {}
+    st.session_state.rerun_forms = set()
+    st.session_state.rerun_count = st.session_state.get("rerun_count", 0) + 1
+    begin_rerun(st.session_state.setdefault("profile_session", uuid.uuid4().hex[:8]), st.session_state.rerun_count)
 
     st.title("Customer Management System")
 
     if st.session_state.logged_in:
         st.subheader(f"Welcome, {st.session_state.username}")
-        
+
+        # Unlike st.tabs, which runs every tab's body, only the selected section
+        # runs its queries and rendering on each rerun
         if st.session_state.is_admin:
             st.subheader("Admin Panel")
-            admin_tabs = st.tabs(["View All Users", "Edit User Details", "Delete User", "Request for Password", "Analysis"])
-
-            with admin_tabs[0]:
-                st.subheader("View All Users")
-                users = get_all_users()
-                user_list = [user["username"] for user in users]
-                selected_user = st.selectbox("Select User to view details", user_list, key="view_user", index=0)
-
-                if selected_user:
-                    user_details = get_customer_detail(selected_user)
-                    if user_details:
-                        st.write("Username:", user_details.get("username", "N/A"))
-                        st.write("Contact:", user_details.get("contact", "N/A"))
-                        st.write("Email:", user_details.get("email", "N/A"))
-                        st.write("Product:", user_details.get("product", "N/A"))
-                        st.write("Type:", user_details.get("type", "N/A"))
-                        st.write("Location:", user_details.get("location", "N/A"))
-                        st.write("Name:", user_details.get("name", "N/A"))
-                        st.write("Type of Entity:", user_details.get("type_of_entity", "N/A"))
-                        st.write("Contact Person:", user_details.get("contact_person", "N/A"))
-                        st.write("Mobile 1:", user_details.get("mobile_1", "N/A"))
-                        st.write("Mobile 2:", user_details.get("mobile_2", "N/A"))
-                        for key in ["Signed Agreement", "PAN", "Cancelled Cheque", "GST", "Shop Establishment Certificate", "Partnership Deed", "Certificate of Incorporation"]:
-                            if key in user_details:
-                                display_file(user_details[key])
-
-                st.markdown('<div class="logout-button">', unsafe_allow_html=True)
-                if st.button("Logout", key="logout_view"):
-                    st.session_state.logged_in = False
-                    st.session_state.username = ""
-                    st.session_state.is_admin = False
-                    st.session_state.new_user = False
-                    st.experimental_rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            with admin_tabs[1]:
-                st.subheader("Edit User Details")
-                users = get_all_users()
-                user_list = [user["username"] for user in users]
-                selected_user = st.selectbox("Select User to edit details", user_list, key="edit_user", index=0)
-
-                if selected_user:
-                    user_details = get_customer_detail(selected_user)
-                    if user_details:
-                        username = user_details.get("username", "")
-                        contact = st.text_input("Contact", user_details.get("contact", ""))
-                        email = st.text_input("Email", user_details.get("email", ""))
-                        product = st.selectbox("Product", ["Secured", "Unsecured"], index=["Secured", "Unsecured"].index(user_details.get("product", "Secured")), key="edit_product")
-                        type_ = st.selectbox("Type", ["Referral", "Connector"], index=["Referral", "Connector"].index(user_details.get("type", "Referral")), key="edit_type")
-                        location = st.selectbox("Location", ["Mumbai", "Kalyan", "Panvel"], index=["Mumbai", "Kalyan", "Panvel"].index(user_details.get("location", "Mumbai")), key="edit_location")
-                        name = st.text_input("Name", value=user_details.get("name", ""), key="edit_name")
-                        type_of_entity = st.selectbox("Type of Entity", ["Individual", "Proprietor", "Partnership", "LLP", "Pvt Ltd"], index=["Individual", "Proprietor", "Partnership", "LLP", "Pvt Ltd"].index(user_details.get("type_of_entity", "Individual")), key="edit_type_of_entity")
-                        contact_person = st.text_input("Contact Person", value=user_details.get("contact_person", ""), key="edit_contact_person")
-                        mobile_1 = st.text_input("Mobile 1", value=user_details.get("mobile_1", ""), key="edit_mobile_1")
-                        mobile_2 = st.text_input("Mobile 2", value=user_details.get("mobile_2", ""), key="edit_mobile_2")
-
-                        uploads = {
-                            "Signed Agreement": st.file_uploader("Signed Agreement (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="edit_signed_agreement"),
-                            "PAN": st.file_uploader("PAN (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="edit_pan"),
-                            "Cancelled Cheque": st.file_uploader("Cancelled Cheque (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="edit_cancelled_cheque"),
-                            "GST": st.file_uploader("GST (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="edit_gst"),
-                            "Shop Establishment Certificate": st.file_uploader("Shop Establishment Certificate (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="edit_shop_establishment"),
-                            "Partnership Deed": st.file_uploader("Partnership Deed (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="edit_partnership_deed"),
-                            "Certificate of Incorporation": st.file_uploader("Certificate of Incorporation (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="edit_certificate_of_incorporation"),
-                        }
-
-                        if st.button("Update User"):
-                            updated_details = {
-                                "contact": contact,
-                                "email": email,
-                                "product": product,
-                                "type": type_,
-                                "location": location,
-                                "name": name,
-                                "type_of_entity": type_of_entity,
-                                "contact_person": contact_person,
-                                "mobile_1": mobile_1,
-                                "mobile_2": mobile_2
-                            }
-                            for key, file in uploads.items():
-                                if file:
-                                    file_id = fs.put(file.getvalue(), filename=file.name, content_type=file.type)
-                                    updated_details[key] = file_id
-                            update_customer_detail(username, updated_details)
-                            st.success("User details updated successfully!")
-
-                st.markdown('<div class="logout-button">', unsafe_allow_html=True)
-                if st.button("Logout", key="logout_edit"):
-                    st.session_state.logged_in = False
-                    st.session_state.username = ""
-                    st.session_state.is_admin = False
-                    st.session_state.new_user = False
-                    st.experimental_rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            with admin_tabs[2]:
-                st.subheader("Delete User")
-                users = get_all_users()
-                user_list = [user["username"] for user in users]
-                selected_user = st.selectbox("Select User to delete", user_list, key="delete_user", index=0)
-
-                if selected_user:
-                    if st.button("Delete User"):
-                        delete_user(selected_user)
-                        st.success("User deleted successfully!")
-
-                st.markdown('<div class="logout-button">', unsafe_allow_html=True)
-                if st.button("Logout", key="logout_delete"):
-                    st.session_state.logged_in = False
-                    st.session_state.username = ""
-                    st.session_state.is_admin = False
-                    st.session_state.new_user = False
-                    st.experimental_rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            with admin_tabs[3]:
-                st.subheader("Request for Password")
-                requests = get_password_reset_requests()
-                requests_list = list(requests)
-                if requests_list:
-                    df_requests = pd.DataFrame(requests_list)
-                    df_requests = df_requests[['username', 'contact']]  # Select relevant columns
-                    st.write(df_requests)
-                    for index, row in df_requests.iterrows():
-                        if st.button(f"Delete {row['username']}", key=f"delete_{row['username']}"):
-                            delete_password_reset_request(row['username'])
-                            st.experimental_rerun()
-                else:
-                    st.write("No password reset requests found.")
-
-                st.markdown('<div class="logout-button">', unsafe_allow_html=True)
-                if st.button("Logout", key="logout_requests"):
-                    st.session_state.logged_in = False
-                    st.session_state.username = ""
-                    st.session_state.is_admin = False
-                    st.session_state.new_user = False
-                    st.experimental_rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
-
-            with admin_tabs[4]:
-                st.subheader("Analysis")
-                users = get_all_users()
-                users_list = list(users)
-                if users_list:
-                    df = pd.DataFrame(users_list)
-                    st.write(f"Total number of users: {len(df)}")
-
-                    columns = df.columns.tolist()
-                    selected_columns = st.multiselect("Select columns for analysis", columns, placeholder="Select columns")
-                    chart_type = st.selectbox("Select chart type", ["Bar", "Line", "Scatter", "Histogram", "Pie"], placeholder="Select chart type")
-
-                    if selected_columns:
-                        if chart_type == "Bar":
-                            fig = px.bar(df, x=selected_columns[0], y=selected_columns[1])
-                        elif chart_type == "Line":
-                            fig = px.line(df, x=selected_columns[0], y=selected_columns[1])
-                        elif chart_type == "Scatter":
-                            fig = px.scatter(df, x=selected_columns[0], y=selected_columns[1])
-                        elif chart_type == "Histogram":
-                            fig = px.histogram(df, x=selected_columns[0])
-                        elif chart_type == "Pie":
-                            fig = px.pie(df, names=selected_columns[0], values=selected_columns[1])
-
-                        st.plotly_chart(fig)
-                    else:
-                        st.write("Please select columns for analysis")
-
-                st.markdown('<div class="logout-button">', unsafe_allow_html=True)
-                if st.button("Logout", key="logout_analysis"):
-                    st.session_state.logged_in = False
-                    st.session_state.username = ""
-                    st.session_state.is_admin = False
-                    st.session_state.new_user = False
-                    st.experimental_rerun()
-                st.markdown('</div>', unsafe_allow_html=True)
+            section = st.radio("Admin section", list(ADMIN_SECTIONS), horizontal=True, key="admin_section", label_visibility="collapsed")
+            ADMIN_SECTIONS[section]()
+            logout_button("logout_admin")
 
         else:
             st.subheader("Customer Management")
             details = get_customer_detail(st.session_state.username)
-            
+
             if st.session_state.new_user or not details:
-                tabs = st.tabs(["Add Details", "View Details", "Update Details"])
+                sections = ["Add Details", "View Details", "Update Details"]
             else:
-                tabs = st.tabs(["View Details", "Update Details"])
-
-            if len(tabs) == 3:  # Check if the "Add Details" tab is present
-                with tabs[0]:
-                    st.subheader("Add Details")
-                    product = st.selectbox("Product", ["Secured", "Unsecured"], key="add_product")
-                    type_ = st.selectbox("Type", ["Referral", "Connector"], key="add_type")
-                    location = st.selectbox("Location", ["Mumbai", "Kalyan", "Panvel"], key="add_location")
-                    name = st.text_input("Name", key="add_name")
-                    type_of_entity = st.selectbox("Type of Entity", ["Individual", "Proprietor", "Partnership", "LLP", "Pvt Ltd"], key="add_type_of_entity")
-                    contact_person = st.text_input("Contact Person", key="add_contact_person")
-                    mobile_1 = st.text_input("Mobile 1", key="add_mobile_1")
-                    mobile_2 = st.text_input("Mobile 2", key="add_mobile_2")
-                    
-                    uploads = {
-                        "Signed Agreement": st.file_uploader("Signed Agreement (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="add_signed_agreement"),
-                        "PAN": st.file_uploader("PAN (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="add_pan"),
-                        "Cancelled Cheque": st.file_uploader("Cancelled Cheque (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="add_cancelled_cheque"),
-                        "GST": st.file_uploader("GST (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="add_gst"),
-                        "Shop Establishment Certificate": st.file_uploader("Shop Establishment Certificate (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="add_shop_establishment"),
-                        "Partnership Deed": st.file_uploader("Partnership Deed (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="add_partnership_deed"),
-                        "Certificate of Incorporation": st.file_uploader("Certificate of Incorporation (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="add_certificate_of_incorporation"),
-                    }
-
-                    if st.button("Submit", key="add_submit"):
-                        if not (mobile_1.isdigit() and len(mobile_1) == 10 and mobile_2.isdigit() and len(mobile_2) == 10):
-                            st.error("Both mobile numbers must be 10-digit numerical values.")
-                        elif not (uploads["Signed Agreement"] and uploads["PAN"] and uploads["Cancelled Cheque"]):
-                            st.error("Signed Agreement, PAN, and Cancelled Cheque are compulsory.")
-                        else:
-                            details = {
-                                "username": st.session_state.username,
-                                "product": product,
-                                "type": type_,
-                                "location": location,
-                                "name": name,
-                                "type_of_entity": type_of_entity,
-                                "contact_person": contact_person,
-                                "mobile_1": mobile_1,
-                                "mobile_2": mobile_2,
-                            }
-                            for key, file in uploads.items():
-                                if file:
-                                    file_id = fs.put(file.getvalue(), filename=file.name, content_type=file.type)
-                                    details[key] = file_id
-                            add_customer_detail(details)
-                            st.success("Details submitted successfully!")
-                            st.experimental_rerun()
-
-            with tabs[1 if len(tabs) == 3 else 0]:
-                st.subheader("View Details")
-                details = get_customer_detail(st.session_state.username)
-                if details:
-                    st.write("Product:", details.get("product", "N/A"))
-                    st.write("Type:", details.get("type", "N/A"))
-                    st.write("Location:", details.get("location", "N/A"))
-                    st.write("Name:", details.get("name", "N/A"))
-                    st.write("Type of Entity:", details.get("type_of_entity", "N/A"))
-                    st.write("Contact Person:", details.get("contact_person", "N/A"))
-                    st.write("Mobile 1:", details.get("mobile_1", "N/A"))
-                    st.write("Mobile 2:", details.get("mobile_2", "N/A"))
-                    for key in ["Signed Agreement", "PAN", "Cancelled Cheque", "GST", "Shop Establishment Certificate", "Partnership Deed", "Certificate of Incorporation"]:
-                        if key in details:
-                            display_file(details[key])
-                else:
-                    st.write("No details found.")
-
-            with tabs[2 if len(tabs) == 3 else 1]:
-                st.subheader("Update Details")
-                details = get_customer_detail(st.session_state.username)
-                if details:
-                    product = st.selectbox("Product", ["Secured", "Unsecured"], index=["Secured", "Unsecured"].index(details.get("product", "Secured")), key="update_product")
-                    type_ = st.selectbox("Type", ["Referral", "Connector"], index=["Referral", "Connector"].index(details.get("type", "Referral")), key="update_type")
-                    location = st.selectbox("Location", ["Mumbai", "Kalyan", "Panvel"], index=["Mumbai", "Kalyan", "Panvel"].index(details.get("location", "Mumbai")), key="update_location")
-                    name = st.text_input("Name", value=details.get("name", ""), key="update_name")
-                    type_of_entity = st.selectbox("Type of Entity", ["Individual", "Proprietor", "Partnership", "LLP", "Pvt Ltd"], index=["Individual", "Proprietor", "Partnership", "LLP", "Pvt Ltd"].index(details.get("type_of_entity", "Individual")), key="update_type_of_entity")
-                    contact_person = st.text_input("Contact Person", value=details.get("contact_person", ""), key="update_contact_person")
-                    mobile_1 = st.text_input("Mobile 1", value=details.get("mobile_1", ""), key="update_mobile_1")
-                    mobile_2 = st.text_input("Mobile 2", value=details.get("mobile_2", ""), key="update_mobile_2")
-
-                    uploads = {
-                        "Signed Agreement": st.file_uploader("Signed Agreement (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="update_signed_agreement"),
-                        "PAN": st.file_uploader("PAN (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="update_pan"),
-                        "Cancelled Cheque": st.file_uploader("Cancelled Cheque (Compulsory)", type=["jpg", "jpeg", "png", "pdf"], key="update_cancelled_cheque"),
-                        "GST": st.file_uploader("GST (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="update_gst"),
-                        "Shop Establishment Certificate": st.file_uploader("Shop Establishment Certificate (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="update_shop_establishment"),
-                        "Partnership Deed": st.file_uploader("Partnership Deed (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="update_partnership_deed"),
-                        "Certificate of Incorporation": st.file_uploader("Certificate of Incorporation (Optional)", type=["jpg", "jpeg", "png", "pdf"], key="update_certificate_of_incorporation"),
-                    }
-
-                    if st.button("Update", key="update_submit"):
-                        if not (mobile_1.isdigit() and len(mobile_1) == 10 and mobile_2.isdigit() and len(mobile_2) == 10):
-                            st.error("Both mobile numbers must be 10-digit numerical values.")
-                        else:
-                            updated_details = {
-                                "product": product,
-                                "type": type_,
-                                "location": location,
-                                "name": name,
-                                "type_of_entity": type_of_entity,
-                                "contact_person": contact_person,
-                                "mobile_1": mobile_1,
-                                "mobile_2": mobile_2,
-                            }
-                            for key, file in uploads.items():
-                                if file:
-                                    file_id = fs.put(file.getvalue(), filename=file.name, content_type=file.type)
-                                    updated_details[key] = file_id
-                            update_customer_detail(st.session_state.username, updated_details)
-                            st.success("Your details have been updated successfully!")
-                            st.experimental_rerun()
-                            
-
-            st.markdown('<div class="logout-button">', unsafe_allow_html=True)
-            if st.button("Logout"):
-                st.session_state.logged_in = False
-                st.session_state.username = ""
-                st.session_state.is_admin = False
-                st.session_state.new_user = False
-                st.experimental_rerun()
-            st.markdown('</div>', unsafe_allow_html=True)
+                sections = ["View Details", "Update Details"]
+            if st.session_state.get("customer_section") not in sections:
+                st.session_state.customer_section = sections[0]
+            section = st.radio("Section", sections, horizontal=True, key="customer_section", label_visibility="collapsed")
+            CUSTOMER_SECTIONS[section](details)
+            logout_button("logout")
 
     else:
         st.subheader("Login or Register")
@@ -435,19 +691,24 @@ def main():
             contact = st.text_input("Contact (10-digit number)", key="register_contact")
             if st.button("Register", key="register_submit"):
                 if new_username.strip() and new_password.strip() and contact.strip():
-                    if not contact.isdigit() or len(contact) != 10:
+                    if not is_phone_number(contact):
                         st.error("Contact number must be a 10-digit numerical value")
                     else:
                         existing_user = collection.find_one({"username": new_username})
                         if existing_user:
                             st.error("Username already exists")
                         else:
-                            register_user(new_username, new_password, contact)
-                            st.success("You have registered successfully!")
-                            st.session_state.logged_in = True
-                            st.session_state.username = new_username
-                            st.session_state.new_user = True  # Mark as a new user
-                            st.experimental_rerun()
+                            # The unique username index rejects a registration that lost a race
+                            try:
+                                register_user(new_username, new_password, contact)
+                            except DuplicateKeyError:
+                                st.error("Username already exists")
+                            else:
+                                st.success("You have registered successfully!")
+                                st.session_state.logged_in = True
+                                st.session_state.username = new_username
+                                st.session_state.new_user = True  # Mark as a new user
+                                st.experimental_rerun()
                 else:
                     st.error("Please provide username, password, and contact")
 
@@ -455,7 +716,7 @@ def main():
             reset_username = st.text_input("Username to Reset Password", key="reset_username")
             reset_contact = st.text_input("Contact to verify", key="reset_contact")
             if st.button("Reset Password Request", key="reset_submit"):
-                if reset_username.strip() and reset_contact.strip() and reset_contact.isdigit() and len(reset_contact) == 10:
+                if reset_username.strip() and is_phone_number(reset_contact):
                     user = collection.find_one({"username": reset_username, "contact": reset_contact})
                     if user:
                         add_password_reset_request(reset_username, reset_contact)
@@ -480,5 +741,7 @@ def main():
                 else:
                     st.error("Please provide both admin username and password")
 
+    drop_unrendered_snapshots()
+
 if __name__ == '__main__':
     main()
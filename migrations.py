@@ -0,0 +1,217 @@
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+DUPLICATES_SHOWN = 20
+
+
+class MigrationError(Exception):
+    pass
+
+
+def duplicate_usernames(db, limit=DUPLICATES_SHOWN):
+    # Registration used to check and then insert, so a race may have left two
+    # customers with one username; those block the unique index
+    return [doc["_id"] for doc in db["customer"].aggregate([
+        {"$group": {"_id": "$username", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"_id": 1}},
+        {"$limit": limit},
+    ], allowDiskUse=True)]
+
+
+# Each migration is (version, description, function(db)). Versions must only
+# ever be appended; an applied version is never re-run.
+def _customer_indexes(db):
+    duplicates = duplicate_usernames(db)
+    if duplicates:
+        raise MigrationError(
+            "Cannot create the unique username index, these usernames belong to more than one customer"
+            f" (first {DUPLICATES_SHOWN} shown): {', '.join(map(str, duplicates))}. Rename or delete the extra customers and restart."
+        )
+    customers = db["customer"]
+    customers.create_index([("username", ASCENDING)], unique=True, name="username_unique")
+    customers.create_index([("username", ASCENDING), ("contact", ASCENDING)], name="username_contact")
+    customers.create_index(
+        [("password_reset_request", ASCENDING)],
+        name="password_reset_request_partial",
+        partialFilterExpression={"password_reset_request": True},
+    )
+
+
+def _user_search_indexes(db):
+    customers = db["customer"]
+    for field in ["name", "contact", "mobile_1", "mobile_2"]:
+        customers.create_index([(field, ASCENDING)], name=f"{field}_search")
+
+
+def _derivative_index(db):
+    db["fs.files"].create_index([("metadata.derivative_of", ASCENDING)], name="derivative_of", sparse=True)
+
+
+def _content_hash_index(db):
+    db["fs.files"].create_index(
+        [("sha256", ASCENDING)],
+        name="sha256_unique",
+        unique=True,
+        partialFilterExpression={"sha256": {"$exists": True}},
+    )
+
+
+def _mail_queue_indexes(db):
+    mail_queue = db["mail_queue"]
+    mail_queue.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt")
+    mail_queue.create_index([("status", ASCENDING), ("locked_at", ASCENDING)], name="status_locked_at")
+    mail_queue.create_index([("sent_at", ASCENDING)], name="sent_at_ttl", expireAfterSeconds=30 * 24 * 3600)
+
+
+RESET_REQUEST_TTL_DAYS = 30
+
+
+def _reset_request_collection(db):
+    requests = db["password_reset_requests"]
+    requests.create_index([("status", ASCENDING), ("_id", ASCENDING)], name="status_id")
+    requests.create_index(
+        [("username", ASCENDING)],
+        name="username_pending_unique",
+        unique=True,
+        partialFilterExpression={"status": "pending"},
+    )
+    requests.create_index([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=RESET_REQUEST_TTL_DAYS * 24 * 3600)
+
+    customers = db["customer"]
+    now = datetime.now(timezone.utc)
+    for customer in customers.find({"password_reset_request": True}, {"username": 1, "contact": 1, "reset_contact": 1}):
+        try:
+            requests.update_one(
+                {"username": customer["username"], "status": "pending"},
+                {"$setOnInsert": {"contact": customer.get("reset_contact", customer.get("contact")), "created_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another process moving the same request got there first
+            pass
+    customers.update_many({"password_reset_request": {"$exists": True}}, {"$unset": {"password_reset_request": "", "reset_contact": ""}})
+    if "password_reset_request_partial" in customers.index_information():
+        try:
+            customers.drop_index("password_reset_request_partial")
+        except OperationFailure:
+            pass
+
+
+MIGRATIONS = [
+    (1, "customer indexes: username, username+contact, pending reset requests", _customer_indexes),
+    (2, "customer search indexes: name, contact, mobile_1, mobile_2", _user_search_indexes),
+    (3, "GridFS derivative lookup index", _derivative_index),
+    (4, "GridFS content hash index for deduplication", _content_hash_index),
+    (5, "mail queue indexes: claim order, stale claims, 30 day expiry of sent mail", _mail_queue_indexes),
+    (6, "move password reset requests out of customer documents into their own collection", _reset_request_collection),
+]
+
+# Index names every hot helper relies on, checked on startup
+EXPECTED_INDEXES = {
+    "customer": [
+        "username_unique", "username_contact",
+        "name_search", "contact_search", "mobile_1_search", "mobile_2_search",
+    ],
+    "fs.files": ["derivative_of", "sha256_unique"],
+    "mail_queue": ["status_next_attempt", "status_locked_at", "sent_at_ttl"],
+    "password_reset_requests": ["status_id", "username_pending_unique", "created_at_ttl"],
+}
+
+
+def applied_versions(db):
+    return {doc["_id"] for doc in db[MIGRATIONS_COLLECTION].find({}, {"_id": 1})}
+
+
+def run_migrations(db):
+    done = applied_versions(db)
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        # Every migration is idempotent, so two processes starting together may both
+        # run one; the second marker insert loses the race and is not an error
+        migrate(db)
+        try:
+            db[MIGRATIONS_COLLECTION].insert_one({
+                "_id": version,
+                "description": description,
+                "applied_at": datetime.now(timezone.utc),
+            })
+        except DuplicateKeyError:
+            continue
+        applied.append(version)
+    return applied
+
+
+def check_indexes(db):
+    missing = {}
+    for collection_name, names in EXPECTED_INDEXES.items():
+        existing = db[collection_name].index_information()
+        absent = [name for name in names if name not in existing]
+        if absent:
+            missing[collection_name] = absent
+    return missing
+
+
+def index_usage(collection):
+    return [
+        {"name": stat["name"], "ops": stat["accesses"]["ops"], "since": stat["accesses"]["since"]}
+        for stat in collection.aggregate([{"$indexStats": {}}])
+    ]
+
+
+def _winning_stage(plan):
+    stages = []
+    while plan:
+        stages.append(plan.get("stage"))
+        plan = plan.get("inputStage")
+    return stages
+
+
+def explain_query(collection, query):
+    explanation = collection.find(query).explain()
+    winning_plan = explanation["queryPlanner"]["winningPlan"]
+    stats = explanation.get("executionStats", {})
+    stages = _winning_stage(winning_plan.get("queryPlan", winning_plan))
+    return {
+        "query": query,
+        "stages": stages,
+        "uses_index": "COLLSCAN" not in stages,
+        "docs_examined": stats.get("totalDocsExamined"),
+        "keys_examined": stats.get("totalKeysExamined"),
+    }
+
+
+# Queries issued by the helpers in main.py, used to confirm they hit an index
+HOT_QUERIES = [
+    {"username": "example", "password": "example"},
+    {"username": "example"},
+    {"username": "example", "contact": "0000000000"},
+    {"name": {"$regex": "^example"}},
+    {"mobile_1": {"$regex": "^98"}},
+]
+
+
+def index_report(db):
+    customers = db["customer"]
+    return {
+        "missing": check_indexes(db),
+        "usage": index_usage(customers),
+        "plans": [explain_query(customers, query) for query in HOT_QUERIES],
+    }
+
+
+if __name__ == "__main__":
+    import pprint
+    import sys
+
+    from pymongo import MongoClient
+
+    client = MongoClient(sys.argv[1] if len(sys.argv) > 1 else "mongodb://localhost:27017")
+    database = client["Fintree_Finance"]
+    print("Applied migrations:", run_migrations(database) or "none")
+    pprint.pprint(index_report(database))
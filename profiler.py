@@ -0,0 +1,206 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from pymongo import monitoring
+
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 100))
+SLOW_QUERY_LOG_SIZE = int(os.environ.get("SLOW_QUERY_LOG_SIZE", 200))
+PROFILE_RERUNS = int(os.environ.get("PROFILE_RERUNS", 500))
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Wrappers that sit between a helper and the driver and would hide the real caller
+SKIPPED_FILES = {os.path.join(PROJECT_DIR, name) for name in ("profiler.py", "db.py", "read_cache.py")}
+
+_context = threading.local()
+
+
+def begin_rerun(session, rerun):
+    # Called by main() at the top of every rerun; the script thread keeps this
+    # context until its next rerun, so every command it sends is attributed to it
+    _context.rerun = (session, rerun)
+    profiler.start_rerun(session, rerun)
+
+
+def _qualname(code):
+    return getattr(code, "co_qualname", code.co_name)
+
+
+def _call_site():
+    # The innermost project function on the stack and the driver method it called,
+    # e.g. "main.get_customer_detail -> Collection.find_one"
+    frame = sys._getframe(1)
+    callee = None
+    in_project = False
+    while frame is not None:
+        code = frame.f_code
+        if os.path.dirname(code.co_filename) == PROJECT_DIR:
+            in_project = True
+            if code.co_filename not in SKIPPED_FILES and not code.co_name.startswith("<"):
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+                return f"{module}.{_qualname(code)} -> {callee}" if callee else f"{module}.{_qualname(code)}"
+        elif not in_project:
+            callee = _qualname(code)
+        frame = frame.f_back
+    return callee or "unknown"
+
+
+def _returned(reply):
+    cursor = reply.get("cursor")
+    if cursor:
+        return cursor.get("firstBatch", cursor.get("nextBatch", []))
+    if reply.get("value") is not None:
+        return [reply["value"]]
+    return []
+
+
+def _estimated_size(documents):
+    # Counts the top-level strings and binaries (GridFS chunk data, names, numbers)
+    # plus a flat 16 bytes for every other field, instead of encoding the reply again
+    size = 0
+    for document in documents:
+        for value in document.values():
+            size += len(value) if isinstance(value, (bytes, str)) else 16
+    return size
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+class CommandProfiler(monitoring.CommandListener):
+    def __init__(self):
+        # Set by db.get_client when MONGO_PROFILE_COMMANDS is on
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._reruns = OrderedDict()
+            self._slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+            self._sites = {}
+            self._histograms = {}
+
+    def start_rerun(self, session, rerun):
+        with self._lock:
+            self._reruns[(session, rerun)] = {
+                "session": session,
+                "rerun": rerun,
+                "started": time.time(),
+                "commands": 0,
+                "duration_ms": 0.0,
+                "documents": 0,
+                "bytes": 0,
+            }
+            while len(self._reruns) > PROFILE_RERUNS:
+                self._reruns.popitem(last=False)
+
+    def started(self, event):
+        # Published in the thread that runs the operation, so the stack and the
+        # thread-local rerun still belong to the caller
+        target = event.command.get(event.command_name)
+        self._inflight[(event.request_id, event.connection_id)] = (
+            getattr(_context, "rerun", None),
+            _call_site(),
+            target if isinstance(target, str) else None,
+        )
+
+    def succeeded(self, event):
+        documents = _returned(event.reply)
+        self._record(event, documents=len(documents) or event.reply.get("n", 0), size=_estimated_size(documents), failed=False)
+
+    def failed(self, event):
+        self._record(event, documents=0, size=0, failed=True)
+
+    def _record(self, event, documents, size, failed):
+        rerun, site, collection = self._inflight.pop((event.request_id, event.connection_id), (None, "unknown", None))
+        duration_ms = event.duration_micros / 1000
+        command = event.command_name
+        slow = duration_ms >= SLOW_QUERY_MS
+        with self._lock:
+            stats = self._sites.setdefault((site, command), {"count": 0, "duration_ms": 0.0, "max_ms": 0.0, "documents": 0, "bytes": 0, "failures": 0, "slow": 0})
+            stats["count"] += 1
+            stats["duration_ms"] += duration_ms
+            stats["max_ms"] = max(stats["max_ms"], duration_ms)
+            stats["documents"] += documents
+            stats["bytes"] += size
+            stats["failures"] += failed
+            stats["slow"] += slow
+
+            buckets = self._histograms.setdefault(command, [0] * len(DURATION_BUCKETS))
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration_ms / 1000 <= bound:
+                    buckets[index] += 1
+
+            record = self._reruns.get(rerun)
+            if record is not None:
+                record["commands"] += 1
+                record["duration_ms"] += duration_ms
+                record["documents"] += documents
+                record["bytes"] += size
+
+            if slow or failed:
+                self._slow.append({
+                    "time": time.time(),
+                    "session": rerun[0] if rerun else None,
+                    "rerun": rerun[1] if rerun else None,
+                    "thread": threading.current_thread().name,
+                    "call_site": site,
+                    "command": command,
+                    "collection": collection,
+                    "duration_ms": round(duration_ms, 2),
+                    "documents": documents,
+                    "bytes": size,
+                    "failed": failed,
+                })
+
+    def reruns(self, session=None):
+        with self._lock:
+            records = [dict(record) for record in self._reruns.values() if session is None or record["session"] == session]
+        return records[::-1]
+
+    def slow_queries(self):
+        with self._lock:
+            return list(self._slow)[::-1]
+
+    def top_call_sites(self, limit=20):
+        with self._lock:
+            sites = [{"call_site": site, "command": command, **stats} for (site, command), stats in self._sites.items()]
+        sites.sort(key=lambda site: site["duration_ms"], reverse=True)
+        return sites[:limit]
+
+    def prometheus_text(self):
+        with self._lock:
+            sites = {key: dict(stats) for key, stats in self._sites.items()}
+            histograms = {command: list(buckets) for command, buckets in self._histograms.items()}
+        lines = []
+        metrics = [
+            ("mongo_commands_total", "counter", "Commands sent to MongoDB", "count", 1),
+            ("mongo_command_seconds_total", "counter", "Time spent in MongoDB commands", "duration_ms", 1000),
+            ("mongo_command_documents_total", "counter", "Documents returned or affected", "documents", 1),
+            ("mongo_command_reply_bytes_total", "counter", "Approximate reply size in bytes", "bytes", 1),
+            ("mongo_command_failures_total", "counter", "Failed commands", "failures", 1),
+            ("mongo_slow_commands_total", "counter", f"Commands slower than {SLOW_QUERY_MS:g} ms", "slow", 1),
+        ]
+        for name, kind, description, field, divisor in metrics:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            for (site, command), stats in sorted(sites.items()):
+                lines.append(f'{name}{{command="{_escape(command)}",call_site="{_escape(site)}"}} {stats[field] / divisor:g}')
+        lines += ["# HELP mongo_command_duration_seconds MongoDB command latency", "# TYPE mongo_command_duration_seconds histogram"]
+        for command, buckets in sorted(histograms.items()):
+            total = sum(stats["count"] for (_, name), stats in sites.items() if name == command)
+            seconds = sum(stats["duration_ms"] for (_, name), stats in sites.items() if name == command) / 1000
+            for bound, count in zip(DURATION_BUCKETS, buckets):
+                lines.append(f'mongo_command_duration_seconds_bucket{{command="{_escape(command)}",le="{bound:g}"}} {count}')
+            lines.append(f'mongo_command_duration_seconds_bucket{{command="{_escape(command)}",le="+Inf"}} {total}')
+            lines.append(f'mongo_command_duration_seconds_sum{{command="{_escape(command)}"}} {seconds:g}')
+            lines.append(f'mongo_command_duration_seconds_count{{command="{_escape(command)}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+
+profiler = CommandProfiler()
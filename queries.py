@@ -0,0 +1,25 @@
+import re
+
+from rollups import CUSTOMERS_FILTER
+
+# Query shapes shared by the Streamlit helpers and the REST API, so both page
+# and search through the same indexes
+USER_SEARCH_FIELDS = ["username", "name", "contact", "mobile_1", "mobile_2"]
+
+
+def user_search_filter(query="", after=None):
+    # Anchored, case-sensitive prefix regexes so every $or branch is an index range scan
+    filters = [CUSTOMERS_FILTER]
+    if query:
+        prefix = {"$regex": f"^{re.escape(query)}"}
+        filters.append({"$or": [{field: prefix} for field in USER_SEARCH_FIELDS]})
+    if after is not None:
+        filters.append({"username": {"$gt": after}})
+    return {"$and": filters}
+
+
+def reset_request_filter(after=None):
+    query = {"status": "pending"}
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    return query
@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+READ_CACHE_SIZE = int(os.environ.get("READ_CACHE_SIZE", 1024))
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", 30))
+
+_MISSING = object()
+
+
+class ReadCache:
+    # Two tiers: a dict the caller scopes to one rerun, then a bounded LRU with a
+    # TTL shared by every session in the process. Writers invalidate both tiers.
+    def __init__(self, maxsize=READ_CACHE_SIZE, ttl=READ_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Bumped by every invalidation, so a load that raced with a write is not
+        # stored; _epoch covers clear() and the pruning of _generations
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._counters = {"rerun_hits": 0, "shared_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _shared_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _generation(self, key):
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def _shared_set(self, key, value, generation):
+        with self._lock:
+            if (self._epoch, self._generations.get(key, 0)) != generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def get(self, key, loader, scope=None):
+        if scope is not None and key in scope:
+            self._count("rerun_hits")
+            return _copy(scope[key])
+        value = self._shared_get(key)
+        if value is _MISSING:
+            self._count("misses")
+            generation = self._generation(key)
+            value = loader()
+            self._shared_set(key, value, generation)
+        else:
+            self._count("shared_hits")
+        if scope is not None:
+            scope[key] = value
+        return _copy(value)
+
+    def invalidate(self, *keys, scope=None):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._counters["invalidations"] += 1
+            if len(self._generations) > 4 * self.maxsize:
+                self._generations.clear()
+                self._epoch += 1
+        if scope is not None:
+            for key in keys:
+                scope.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
+            self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["rerun_hits"] + self._counters["shared_hits"] + self._counters["misses"]
+            hits = lookups - self._counters["misses"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "hit_ratio": round(hits / lookups, 3) if lookups else None,
+            }
+
+
+# One instance per process: Streamlit executes main.py afresh on every rerun, so a
+# cache created there would be rebuilt (and empty) each time
+read_cache = ReadCache()
+
+
+def _copy(value):
+    # Callers get their own top-level copy so edits never leak into the cache
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+ROLLUP_COLLECTION = "customer_rollups"
+ROLLUP_FIELDS = ["product", "type", "location", "type_of_entity"]
+# Fields a helper has to read back to compute its rollup deltas
+ROLLUP_PROJECTION = {"_id": 0, "username": 1, **{field: 1 for field in ROLLUP_FIELDS}}
+ADMIN_USERNAME = "finadmin"
+# Every customer except the admin account, for counts, analysis, search and export
+CUSTOMERS_FILTER = {"username": {"$ne": ADMIN_USERNAME}}
+DUPLICATE_KEY = 11000
+RECONCILE_INTERVAL = int(os.environ.get("ROLLUP_RECONCILE_INTERVAL", 3600))
+
+_reconciler = None
+_reconciler_lock = threading.Lock()
+
+
+def rollup_id(field, value):
+    return "total" if field is None else f"{field}:{value}"
+
+
+def _rollup_keys(doc):
+    if not doc or doc.get("username") == ADMIN_USERNAME:
+        return []
+    keys = [(None, None)]
+    for field in ROLLUP_FIELDS:
+        if doc.get(field) is not None:
+            keys.append((field, doc[field]))
+    return keys
+
+
+def rollup_deltas(before, after):
+    counts = Counter()
+    for key in _rollup_keys(before):
+        counts[key] -= 1
+    for key in _rollup_keys(after):
+        counts[key] += 1
+    return [
+        UpdateOne(
+            {"_id": rollup_id(field, value)},
+            {"$inc": {"count": delta}, "$setOnInsert": {"field": field, "value": value}},
+            upsert=True,
+        )
+        for (field, value), delta in counts.items()
+        if delta
+    ]
+
+
+def apply_rollup_deltas(db, before, after):
+    operations = rollup_deltas(before, after)
+    if operations:
+        db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+
+
+def get_rollups(db):
+    rollups = {"total": 0, **{field: {} for field in ROLLUP_FIELDS}}
+    for doc in db[ROLLUP_COLLECTION].find({"count": {"$gt": 0}}):
+        if doc["_id"] == "total":
+            rollups["total"] = doc["count"]
+        elif doc.get("field") in rollups:
+            rollups[doc["field"]][doc["value"]] = doc["count"]
+    return rollups
+
+
+def reconcile(db):
+    # The counters are read before the customers are counted, and each correction is
+    # an $inc conditioned on the counter still holding the value read. A delta applied
+    # meanwhile makes the condition fail, and that counter is left for the next run
+    # instead of being overwritten with a stale count.
+    current = {doc["_id"]: doc.get("count", 0) for doc in db[ROLLUP_COLLECTION].find({}, {"count": 1})}
+
+    facets = {field: [{"$match": {field: {"$ne": None}}}, {"$group": {"_id": f"${field}", "count": {"$sum": 1}}}] for field in ROLLUP_FIELDS}
+    facets["total"] = [{"$count": "count"}]
+    result = next(db["customer"].aggregate([
+        {"$match": CUSTOMERS_FILTER},
+        {"$project": ROLLUP_PROJECTION},
+        {"$facet": facets},
+    ]), {})
+
+    total = result["total"][0]["count"] if result.get("total") else 0
+    expected = {rollup_id(None, None): (None, None, total)}
+    for field in ROLLUP_FIELDS:
+        for group in result.get(field, []):
+            expected[rollup_id(field, group["_id"])] = (field, group["_id"], group["count"])
+
+    drift = {key: expected.get(key, (None, None, 0))[2] - current.get(key, 0) for key in set(expected) | set(current)}
+    drift = {key: delta for key, delta in drift.items() if delta}
+
+    reconciled_at = datetime.now(timezone.utc)
+    operations = []
+    for key, delta in drift.items():
+        field, value, _ = expected.get(key, (None, None, 0))
+        if key in current:
+            operations.append(UpdateOne({"_id": key, "count": current[key]}, {"$inc": {"count": delta}, "$set": {"reconciled_at": reconciled_at}}))
+        else:
+            # Created by a concurrent write if the upsert hits a duplicate key
+            operations.append(UpdateOne(
+                {"_id": key, "count": {"$exists": False}},
+                {"$inc": {"count": delta}, "$set": {"field": field, "value": value, "reconciled_at": reconciled_at}},
+                upsert=True,
+            ))
+    if operations:
+        try:
+            db[ROLLUP_COLLECTION].bulk_write(operations, ordered=False)
+        except BulkWriteError as exc:
+            if any(error["code"] != DUPLICATE_KEY for error in exc.details["writeErrors"]):
+                raise
+    return drift
+
+
+def _reconcile_forever(db, interval):
+    while True:
+        try:
+            reconcile(db)
+        except Exception as exc:
+            print(f"Rollup reconcile failed: {exc}")
+        time.sleep(interval)
+
+
+def start_reconciler(db, interval=RECONCILE_INTERVAL):
+    # One background reconcile loop per process, however many sessions import this
+    global _reconciler
+    with _reconciler_lock:
+        if _reconciler is None or not _reconciler.is_alive():
+            _reconciler = threading.Thread(target=_reconcile_forever, args=(db, interval), name="rollup-reconciler", daemon=True)
+            _reconciler.start()
+    return _reconciler
+
+
+if __name__ == "__main__":
+    from db import get_database
+
+    print("Corrected drift:", reconcile(get_database()) or "none")
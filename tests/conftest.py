@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TEST_DATABASE = "Fintree_Finance_test"
+
+
+@pytest.fixture
+def db():
+    # A throwaway database on the local mongod (MONGO_URI), dropped afterwards
+    pymongo = pytest.importorskip("pymongo")
+    client = pymongo.MongoClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=2000)
+    try:
+        client.admin.command("ping")
+    except pymongo.errors.PyMongoError:
+        pytest.skip("no MongoDB server reachable")
+    client.drop_database(TEST_DATABASE)
+    yield client[TEST_DATABASE]
+    client.drop_database(TEST_DATABASE)
+    client.close()
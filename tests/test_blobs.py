@@ -0,0 +1,87 @@
+import io
+from datetime import timedelta
+
+import pytest
+
+gridfs = pytest.importorskip("gridfs")
+
+from blobs import release_files, replaced_files, store_file, sweep  # noqa: E402
+
+
+class Upload(io.BytesIO):
+    # The parts of Streamlit's UploadedFile that store_file uses
+    def __init__(self, data, name="scan.pdf", type="application/pdf"):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+
+
+@pytest.fixture
+def fs(db):
+    return gridfs.GridFS(db)
+
+
+def refs(db, file_id):
+    file = db["fs.files"].find_one({"_id": file_id})
+    return None if file is None else file.get("refs")
+
+
+def test_identical_uploads_share_one_file(db, fs):
+    first = store_file(db, fs, Upload(b"same content"))
+    second = store_file(db, fs, Upload(b"same content", name="copy.pdf"))
+    assert first == second
+    assert refs(db, first) == 2
+    assert db["fs.files"].count_documents({}) == 1
+    assert store_file(db, fs, Upload(b"other content")) != first
+
+
+def test_reuploading_the_same_content_into_a_field_keeps_the_file(db, fs):
+    file_id = store_file(db, fs, Upload(b"agreement"))
+    before = {"username": "asha", "PAN": file_id}
+    after = {"PAN": store_file(db, fs, Upload(b"agreement"))}
+    assert after["PAN"] == file_id
+    release_files(db, fs, replaced_files(before, after))
+    assert refs(db, file_id) == 1
+    assert fs.exists(file_id)
+
+
+def test_deleting_a_customer_whose_fields_share_a_file_deletes_it_once(db, fs):
+    customer = {"username": "asha", "PAN": store_file(db, fs, Upload(b"scan")), "GST": store_file(db, fs, Upload(b"scan"))}
+    assert customer["PAN"] == customer["GST"]
+    release_files(db, fs, replaced_files(customer, None))
+    assert not fs.exists(customer["PAN"])
+
+
+def test_files_stored_before_deduplication_count_as_one_reference(db, fs):
+    legacy = fs.put(b"old upload", filename="old.pdf")
+    assert refs(db, legacy) is None
+    release_files(db, fs, [legacy])
+    assert not fs.exists(legacy)
+
+    shared = fs.put(b"old shared upload", filename="shared.pdf")
+    db["customer"].insert_one({"username": "asha", "PAN": shared, "GST": shared})
+    report = sweep(db, fs, dry_run=False, grace=timedelta(0))
+    assert report["refcount_fixes"] == 1 and report["orphans"] == []
+    assert refs(db, shared) == 2
+
+
+def test_sweep_dry_run_reports_orphans_and_delete_removes_them(db, fs):
+    kept = store_file(db, fs, Upload(b"in use"))
+    db["customer"].insert_one({"username": "asha", "PAN": kept})
+    orphan = store_file(db, fs, Upload(b"abandoned upload"))
+    thumbnail = fs.put(b"thumbnail", metadata={"derivative_of": orphan})
+
+    report = sweep(db, fs, dry_run=True, grace=timedelta(0))
+    assert [entry["_id"] for entry in report["orphans"]] == [str(orphan)]
+    assert fs.exists(orphan) and fs.exists(thumbnail)
+
+    report = sweep(db, fs, dry_run=False, grace=timedelta(0))
+    assert [entry["_id"] for entry in report["orphans"]] == [str(orphan)]
+    assert not fs.exists(orphan) and not fs.exists(thumbnail)
+    assert fs.exists(kept) and refs(db, kept) == 1
+
+
+def test_sweep_keeps_recent_uploads(db, fs):
+    recent = store_file(db, fs, Upload(b"not saved yet"))
+    assert sweep(db, fs, dry_run=False)["orphans"] == []
+    assert fs.exists(recent)
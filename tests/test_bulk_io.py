@@ -0,0 +1,26 @@
+import io
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from bulk_io import import_customers  # noqa: E402
+
+HEADER = "username,mobile_1,mobile_2,name\n"
+
+
+def test_rows_are_upserted_and_invalid_rows_reported(db):
+    data = HEADER + "asha,9876543210,9876543211,Asha\nravi,123,9876543211,Ravi\n"
+    report = import_customers(db, io.BytesIO(data.encode()), "customers.csv")
+    assert (report["rows"], report["inserted"]) == (2, 1)
+    assert [error["row"] for error in report["errors"]] == [3]
+    assert db["customer"].find_one({"username": "asha"})["name"] == "Asha"
+
+
+def test_file_that_is_not_utf8_is_reported_and_earlier_rows_kept(db):
+    data = (HEADER + "asha,9876543210,9876543211,Asha\nrené,9876543210,9876543211,René\n").encode("cp1252")
+    report = import_customers(db, io.BytesIO(data), "customers.csv")
+    assert report["inserted"] == 1
+    assert report["errors"][0]["row"] == 3
+    assert "could not be read" in report["errors"][0]["errors"][0]
+    assert db["customer"].count_documents({}) == 1
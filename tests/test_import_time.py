@@ -0,0 +1,10 @@
+import pytest
+
+pytest.importorskip("streamlit")
+
+from benchmarks.import_time import HEAVY_MODULES, report  # noqa: E402
+
+
+def test_login_path_imports_no_heavy_modules():
+    result = report()
+    assert result["heavy_modules"] == [], f"main.py imports {result['heavy_modules']} at startup; import them in the sections that use them ({', '.join(HEAVY_MODULES)})"
@@ -0,0 +1,125 @@
+import socket
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("pymongo")
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+import mail_queue  # noqa: E402
+from mail_queue import FAILED, MAIL_COLLECTION, MAIL_MAX_ATTEMPTS, MAIL_RETRY_BASE, QUEUED, SENDING, SENT  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 Message accepted for delivery"
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    inbox = Inbox()
+    controller = aiosmtpd_controller.Controller(inbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(mail_queue, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(mail_queue, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(mail_queue, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(mail_queue, "EMAIL_PASSWORD", "")
+    yield inbox
+    controller.stop()
+
+
+@pytest.fixture
+def smtp_down(monkeypatch):
+    # Nothing listens on this port, so every connection is refused
+    monkeypatch.setattr(mail_queue, "SMTP_SERVER", "127.0.0.1")
+    monkeypatch.setattr(mail_queue, "SMTP_PORT", free_port())
+    monkeypatch.setattr(mail_queue, "SMTP_STARTTLS", False)
+
+
+def deliver(db):
+    session = mail_queue.SMTPSession()
+    batch = mail_queue._claim_batch(db)
+    mail_queue._send_batch(db, session, batch)
+    session.close()
+    return batch
+
+
+def test_enqueued_mail_is_sent(db, smtp):
+    mail_id = mail_queue.enqueue_email(db, "customer@example.com", "Password reset", "Your password was reset.")
+
+    assert len(deliver(db)) == 1
+    mail = db[MAIL_COLLECTION].find_one({"_id": mail_id})
+    assert mail["status"] == SENT
+    assert mail["attempts"] == 1
+    assert [message.rcpt_tos for message in smtp.messages] == [["customer@example.com"]]
+    assert b"Subject: Password reset" in smtp.messages[0].content
+
+
+def test_failed_send_is_retried_with_backoff(db, smtp_down):
+    mail_id = mail_queue.enqueue_email(db, "customer@example.com", "Hello", "Hi")
+    before = datetime.utcnow()
+
+    deliver(db)
+    mail = db[MAIL_COLLECTION].find_one({"_id": mail_id})
+    assert mail["status"] == QUEUED
+    assert mail["attempts"] == 1
+    assert mail["last_error"]
+    assert mail["next_attempt_at"] >= before + timedelta(seconds=MAIL_RETRY_BASE - 1)
+    # Not due yet, so the next poll leaves it alone
+    assert deliver(db) == []
+
+    db[MAIL_COLLECTION].update_one({"_id": mail_id}, {"$set": {"next_attempt_at": before}})
+    deliver(db)
+    mail = db[MAIL_COLLECTION].find_one({"_id": mail_id})
+    assert mail["attempts"] == 2
+    assert mail["next_attempt_at"] >= before + timedelta(seconds=2 * MAIL_RETRY_BASE - 1)
+
+
+def test_mail_fails_after_max_attempts(db, smtp_down):
+    mail_id = mail_queue.enqueue_email(db, "customer@example.com", "Hello", "Hi")
+    db[MAIL_COLLECTION].update_one({"_id": mail_id}, {"$set": {"attempts": MAIL_MAX_ATTEMPTS - 1}})
+
+    deliver(db)
+    mail = db[MAIL_COLLECTION].find_one({"_id": mail_id})
+    assert mail["status"] == FAILED
+    assert mail["attempts"] == MAIL_MAX_ATTEMPTS
+
+
+def test_unexpected_error_is_recorded_not_raised(db, smtp, monkeypatch):
+    def broken_message(mail):
+        raise ValueError("bad address")
+
+    monkeypatch.setattr(mail_queue, "_message", broken_message)
+    mail_id = mail_queue.enqueue_email(db, "customer@example.com", "Hello", "Hi")
+
+    deliver(db)
+    mail = db[MAIL_COLLECTION].find_one({"_id": mail_id})
+    assert mail["status"] == QUEUED
+    assert mail["last_error"] == "bad address"
+
+
+def test_stale_mail_at_attempt_limit_is_failed_on_reclaim(db, smtp):
+    stale = datetime.utcnow() - mail_queue.MAIL_STALE_AFTER - timedelta(minutes=1)
+    crashed = db[MAIL_COLLECTION].insert_one({
+        "to": "customer@example.com", "subject": "Hello", "message": "Hi",
+        "status": SENDING, "attempts": MAIL_MAX_ATTEMPTS, "locked_at": stale, "next_attempt_at": stale,
+    }).inserted_id
+    retried = db[MAIL_COLLECTION].insert_one({
+        "to": "customer@example.com", "subject": "Hello again", "message": "Hi",
+        "status": SENDING, "attempts": 1, "locked_at": stale, "next_attempt_at": stale,
+    }).inserted_id
+
+    deliver(db)
+    assert db[MAIL_COLLECTION].find_one({"_id": crashed})["status"] == FAILED
+    assert db[MAIL_COLLECTION].find_one({"_id": retried})["status"] == SENT
+    assert len(smtp.messages) == 1
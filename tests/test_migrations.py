@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("pymongo")
+
+from migrations import MigrationError, run_migrations  # noqa: E402
+
+
+def test_duplicate_usernames_block_migrations_with_their_names(db):
+    db["customer"].insert_many([{"username": "asha"}, {"username": "asha"}, {"username": "ravi"}])
+    with pytest.raises(MigrationError, match="asha"):
+        run_migrations(db)
+    assert "username_unique" not in db["customer"].index_information()
+
+
+def test_migrations_are_recorded_once(db):
+    applied = run_migrations(db)
+    assert applied == sorted(applied) and applied
+    assert run_migrations(db) == []
@@ -0,0 +1,34 @@
+from read_cache import ReadCache
+
+
+def test_load_that_races_with_invalidate_is_not_cached():
+    cache = ReadCache()
+
+    def load_then_write():
+        value = {"version": 1}
+        cache.invalidate("customer")  # a write lands while the loader runs
+        return value
+
+    assert cache.get("customer", load_then_write) == {"version": 1}
+    assert cache.get("customer", lambda: {"version": 2}) == {"version": 2}
+    assert cache.get("customer", lambda: {"version": 3}) == {"version": 2}
+
+
+def test_load_that_races_with_clear_is_not_cached():
+    cache = ReadCache()
+
+    def load_then_clear():
+        cache.clear()
+        return "old"
+
+    cache.get("customer", load_then_clear)
+    assert cache.get("customer", lambda: "new") == "new"
+
+
+def test_rerun_scope_is_checked_first_and_returns_copies():
+    cache = ReadCache()
+    scope = {}
+    first = cache.get("customer", lambda: {"name": "Asha"}, scope)
+    first["name"] = "edited"
+    assert cache.get("customer", lambda: {"name": "other"}, scope) == {"name": "Asha"}
+    assert cache.stats()["rerun_hits"] == 1
@@ -0,0 +1,137 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+THUMBNAIL_SIZE = (480, 480)
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", 2))
+# Derivative kinds, stored in GridFS with metadata {"derivative_of": <original id>, "kind": ...}
+THUMBNAIL = "thumbnail"
+PDF_PREVIEW = "preview"
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = set()
+# Originals no derivative can be made for (unsupported type, no PDF renderer installed)
+_skipped = set()
+
+
+def _first_pdf_page(data):
+    try:
+        import fitz
+    except ImportError:
+        return None
+    from PIL import Image
+
+    with fitz.open(stream=data, filetype="pdf") as document:
+        if not document.page_count:
+            return None
+        pixmap = document[0].get_pixmap(dpi=96)
+        return Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def _encode(image):
+    from PIL import features
+
+    image = image.convert("RGB")
+    image.thumbnail(THUMBNAIL_SIZE)
+    buffer = io.BytesIO()
+    if features.check("webp"):
+        image.save(buffer, format="WEBP", quality=THUMBNAIL_QUALITY, method=4)
+        return buffer.getvalue(), "image/webp"
+    image.save(buffer, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def render_derivative(data, content_type):
+    from PIL import Image, ImageOps
+
+    if "pdf" in content_type:
+        image, kind = _first_pdf_page(data), PDF_PREVIEW
+    elif "image" in content_type:
+        image, kind = Image.open(io.BytesIO(data)), THUMBNAIL
+        # Lets the JPEG decoder downscale while decoding instead of after
+        image.draft("RGB", THUMBNAIL_SIZE)
+        image = ImageOps.exif_transpose(image)
+    else:
+        return None
+    if image is None:
+        return None
+    return (kind, *_encode(image))
+
+
+def generate_derivatives(file_id):
+    # Runs in a worker process, which opens its own MongoDB client through db.py
+    from db import get_fs
+
+    fs = get_fs()
+    if fs.exists({"metadata.derivative_of": file_id}):
+        return None
+    original = fs.get(file_id)
+    derivative = render_derivative(original.read(), original.content_type or "")
+    if derivative is None:
+        return None
+    kind, data, content_type = derivative
+    return fs.put(
+        data,
+        filename=f"{kind}-{original.filename}",
+        content_type=content_type,
+        metadata={"derivative_of": file_id, "kind": kind},
+    )
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: a forked child would inherit the parent's MongoClient sockets
+            _pool = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _done(file_id, future):
+    _pending.discard(file_id)
+    if future.exception():
+        print(f"Thumbnail generation failed for {file_id}: {future.exception()}")
+    elif future.result() is None:
+        _skipped.add(file_id)
+
+
+def schedule_derivatives(file_id):
+    if file_id in _pending or file_id in _skipped:
+        return
+    _pending.add(file_id)
+    future = _get_pool().submit(generate_derivatives, file_id)
+    future.add_done_callback(lambda future: _done(file_id, future))
+
+
+def find_file_and_derivatives(db, file_id):
+    files = db["fs.files"].find(
+        {"$or": [{"_id": file_id}, {"metadata.derivative_of": file_id}]},
+        {"contentType": 1, "metadata": 1},
+    )
+    original, derivatives = None, {}
+    for file in files:
+        if file["_id"] == file_id:
+            original = file
+        else:
+            derivatives[file["metadata"]["kind"]] = file
+    return original, derivatives
+
+
+if __name__ == "__main__":
+    # Backfill derivatives for documents uploaded before thumbnails existed
+    from db import get_database
+
+    database = get_database()
+    derived = set(database["fs.files"].distinct("metadata.derivative_of"))
+    originals = database["fs.files"].find(
+        {"metadata.derivative_of": {"$exists": False}, "contentType": {"$regex": "image|pdf"}},
+        {"_id": 1},
+    )
+    todo = [file["_id"] for file in originals if file["_id"] not in derived]
+    with ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+        created = [file_id for file_id in pool.map(generate_derivatives, todo) if file_id]
+    print(f"Generated {len(created)} derivatives for {len(todo)} documents")
@@ -0,0 +1,30 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from blobs import release_files, store_file
+
+UPLOAD_WORKERS = int(os.environ.get("UPLOAD_WORKERS", 4))
+
+# Shared by every session so concurrent submissions cannot exhaust the MongoDB pool
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="gridfs-upload")
+
+
+class UploadError(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("Upload failed for " + ", ".join(f"{key} ({error})" for key, error in errors.items()))
+
+
+def upload_files(db, fs, uploads):
+    # Each upload is hashed, then either reuses stored content or is streamed in chunk by chunk
+    futures = {key: _executor.submit(store_file, db, fs, file) for key, file in uploads.items() if file}
+    file_ids, errors = {}, {}
+    for key, future in futures.items():
+        try:
+            file_ids[key] = future.result()
+        except Exception as exc:
+            errors[key] = exc
+    if errors:
+        release_files(db, fs, file_ids.values())
+        raise UploadError(errors)
+    return file_ids
@@ -0,0 +1,44 @@
+# Choices and checks shared by the Streamlit forms, bulk import and the API
+PRODUCTS = ["Secured", "Unsecured"]
+TYPES = ["Referral", "Connector"]
+LOCATIONS = ["Mumbai", "Kalyan", "Panvel"]
+ENTITY_TYPES = ["Individual", "Proprietor", "Partnership", "LLP", "Pvt Ltd"]
+CHOICES = {
+    "product": PRODUCTS,
+    "type": TYPES,
+    "location": LOCATIONS,
+    "type_of_entity": ENTITY_TYPES,
+}
+# What the forms pre-select when a customer has no value yet
+FORM_DEFAULTS = {field: choices[0] for field, choices in CHOICES.items()}
+REQUIRED_DOCUMENTS = ["Signed Agreement", "PAN", "Cancelled Cheque"]
+FILE_TYPES = ["jpg", "jpeg", "png", "pdf"]
+
+# Profile fields a customer document may carry besides username, password and documents
+PROFILE_FIELDS = [
+    "contact", "email", "product", "type", "location", "name",
+    "type_of_entity", "contact_person", "mobile_1", "mobile_2",
+]
+
+
+def is_phone_number(value):
+    return isinstance(value, str) and value.isdigit() and len(value) == 10
+
+
+def validate_details(details, partial=False):
+    # partial=True checks only the fields given (API PATCH); the forms and the import
+    # always send both mobile numbers together
+    errors = []
+    if partial:
+        for field in ("mobile_1", "mobile_2"):
+            if field in details and not is_phone_number(details[field]):
+                errors.append(f"{field} must be a 10-digit numerical value")
+    elif "mobile_1" in details or "mobile_2" in details:
+        if not (is_phone_number(details.get("mobile_1")) and is_phone_number(details.get("mobile_2"))):
+            errors.append("Both mobile numbers must be 10-digit numerical values.")
+    if ((partial and "contact" in details) or details.get("contact")) and not is_phone_number(details["contact"]):
+        errors.append("Contact number must be a 10-digit numerical value")
+    for field, choices in CHOICES.items():
+        if field in details and details[field] not in choices:
+            errors.append(f"{field} must be one of: {', '.join(choices)}")
+    return errors
@@ -0,0 +1,24 @@
+# Optimistic concurrency for customer edits: every profile write increments a
+# version field, and an edit only applies if the document still has the version
+# the form was loaded with
+from validation import FORM_DEFAULTS
+
+
+class VersionConflict(Exception):
+    pass
+
+
+class CustomerDeleted(VersionConflict):
+    pass
+
+
+def changed_fields(loaded, updated):
+    # A missing field counts as the value the form pre-filled for it
+    return {field: value for field, value in updated.items() if loaded.get(field, FORM_DEFAULTS.get(field, "")) != value}
+
+
+def version_filter(version):
+    # Documents written before versioning have no version field and count as version 0
+    if not version:
+        return {"version": {"$in": [0, None]}}
+    return {"version": version}